@@ -5,21 +5,84 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_community.utilities import SQLDatabase
 from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
+from langchain_core.language_models import BaseChatModel
 import streamlit as st
 import sqlalchemy.exc
+import httpx
+import pandas as pd
+import time
+from src.sql_schema import SchemaCache, db_key
+from src.query_cache import QueryCache
+from src.sql_memo import SQLMemo
+from src.sql_results import stream_query
+from src.history import HistoryCompactor
+from src.db_engines import create_pooled_engine, pool_metrics
+from src.sql_guard import SQL_GUARD_EXPLAIN, SQLGuardError, check_cost, guard_sql
+from src.sql_validate import SQL_REPAIR_ATTEMPTS, SQLValidationError
+from src.backends import DB_BACKEND, get_chat_model
+from src.chinook import chinook_uri
+from src.tracing import get_tracer
+from src.trace_callbacks import TraceCallbackHandler
+from src.trace_panel import bind_session, show_trace_panel
+from src.result_shape import EMPTY, INTERPRET, classify, to_markdown
+
+# One pooled engine per DSN, shared by every session in this process
+@st.cache_resource(show_spinner=False)
+def get_database(db_uri: str) -> SQLDatabase:
+    return SQLDatabase(create_pooled_engine(db_uri))
 
 # Database Initialization
 def init_database(user: str, password: str, host: str, port: str, database: str) -> SQLDatabase:
     db_uri = f"mysql+mysqlconnector://{user}:{password}@{host}:{port}/{database}"
+    if DB_BACKEND == "chinook":
+        # Local SQLite stand-in; the connection settings are ignored
+        db_uri = chinook_uri()
     try:
-        db = SQLDatabase.from_uri(db_uri)
+        db = get_database(db_uri)
         return db
     except sqlalchemy.exc.DatabaseError as e:
         st.error(f"Failed to connect to the database: {e}")
         return None
 
-# SQL Chain Generation
+# Groq model used by both chains
+GROQ_MODEL = "mixtral-8x7b-32768"
+
+# Schema snapshot shared by every session connected to the same database
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_schema_cache(db: SQLDatabase) -> SchemaCache:
+    return SchemaCache(db)
+
+# Query results shared by every session connected to the same database
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_query_cache(db: SQLDatabase) -> QueryCache:
+    return QueryCache()
+
+# Question -> SQL memo shared by every session connected to the same database
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_sql_memo(db: SQLDatabase) -> SQLMemo:
+    return SQLMemo()
+
+# Text used to pick relevant tables: the question plus the last user questions,
+# so follow-ups ("and in 2010?") keep the tables of the question they refer to
+def schema_search_text(vars: dict, turns: int = 2) -> str:
+    questions = [m.content for m in vars.get("chat_history", []) if isinstance(m, HumanMessage)]
+    return " ".join(questions[-turns:] + [vars["question"]])
+
+# One keep-alive HTTP connection pool for all Groq calls in this process
+@st.cache_resource(show_spinner=False)
+def get_http_client() -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+    )
+
+# LLM clients are built once per model config and shared across sessions
+@st.cache_resource(show_spinner=False)
+def get_llm(model: str = GROQ_MODEL, temperature: float = 0) -> BaseChatModel:
+    return get_chat_model(model, temperature, http_client=get_http_client(), callbacks=[TraceCallbackHandler()])
+
+# SQL Chain Generation (built once per database connection)
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
 def get_sql_chain(db: SQLDatabase):
     template = """
     You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's database.
@@ -27,7 +90,7 @@ def get_sql_chain(db: SQLDatabase):
     
     <SCHEMA>{schema}</SCHEMA>
     
-    Conversation History: {chat_history}
+    Conversation History: {history}
     
     Write only the SQL query and nothing else. Do not wrap the SQL query in any other text, not even backticks.
     
@@ -44,9 +107,10 @@ def get_sql_chain(db: SQLDatabase):
     """
     
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatGroq(model="mixtral-8x7b-32768", temperature=0)
-    def get_schema(_):
-        return db.get_table_info()
+    llm = get_llm()
+    schema_cache = get_schema_cache(db)
+    def get_schema(vars):
+        return schema_cache.relevant(schema_search_text(vars))
     return (
         RunnablePassthrough.assign(schema=get_schema)
         | prompt
@@ -54,39 +118,183 @@ def get_sql_chain(db: SQLDatabase):
         | StrOutputParser()
     )
 
-# Get Response from SQL Chain
-def get_response(user_query: str, db: SQLDatabase, chat_history: list):
+# Targeted fix-up of SQL that failed local validation (built once per database connection)
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_repair_chain(db: SQLDatabase):
+    template = """
+    The SQL query below was written for a {dialect} database to answer the user's question, but it is invalid.
+    Fix exactly the reported error using only the tables and columns in the schema.
+
+    <SCHEMA>{schema}</SCHEMA>
+
+    Question: {question}
+    SQL Query: {query}
+    Error: {error}
+
+    Write only the corrected SQL query and nothing else. Do not wrap the SQL query in any other text, not even backticks.
+    Corrected SQL Query:
+    """
+    prompt = ChatPromptTemplate.from_template(template)
+    llm = get_llm()
+    schema_cache = get_schema_cache(db)
+    return (
+        RunnablePassthrough.assign(schema=lambda vars: schema_cache.relevant(schema_search_text(vars)))
+        | prompt
+        | llm
+        | StrOutputParser()
+    )
+
+# Question -> guarded SQL stage (built once per database connection)
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_query_chain(db: SQLDatabase):
     sql_chain = get_sql_chain(db)
+    repair_chain = get_repair_chain(db)
+    schema_cache = get_schema_cache(db)
+    query_cache = get_query_cache(db)
+    sql_memo = get_sql_memo(db)
+
+    # Skip the SQL-generation LLM call for questions answered before
+    def generate_sql(vars):
+        fingerprint = schema_cache.snapshot().structure_checksum
+        query, _ = sql_memo.lookup(vars["question"], vars["chat_history"], fingerprint)
+        if query is None:
+            query = sql_chain.invoke(vars)
+        return query
+
+    # Parse and check tables/columns locally; failures go back to the LLM
+    # with the exact error instead of costing a database round trip
+    def validate_sql(vars):
+        query = vars["query"]
+        for attempt in range(SQL_REPAIR_ATTEMPTS + 1):
+            error = schema_cache.snapshot().validator.validate(query, db.dialect)
+            if error is None:
+                return query
+            if attempt == SQL_REPAIR_ATTEMPTS:
+                raise SQLValidationError(error, query)
+            query = repair_chain.invoke({**vars, "query": query, "error": error, "dialect": db.dialect})
+        return query
+
+    # Read-only check, LIMIT and EXPLAIN cost estimate before anything executes;
+    # results already in the query cache need no estimate
+    def check_sql(vars):
+        snapshot = schema_cache.snapshot()
+        guarded = guard_sql(db, vars["query"], explain=False)
+        if SQL_GUARD_EXPLAIN and not query_cache.contains(guarded.sql, snapshot.versions):
+            check_cost(db, guarded)
+        return guarded
+
+    return (
+        RunnablePassthrough.assign(query=generate_sql)
+        .assign(query=validate_sql)
+        .assign(guard=check_sql)
+        .assign(query=lambda vars: vars["guard"].sql)
+    )
+
+# Guarded SQL -> result stage (built once per database connection)
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_execute_chain(db: SQLDatabase):
+    schema_cache = get_schema_cache(db)
+    query_cache = get_query_cache(db)
+    sql_memo = get_sql_memo(db)
+
+    # Only SQL that actually ran is memoized
+    def run_sql(vars):
+        snapshot = schema_cache.snapshot()
+        # Bounded preview + single-pass summary instead of the full stringified result
+        executed = []
+
+        def execute(sql):
+            executed.append(sql)
+            return stream_query(db, sql)
+
+        with get_tracer().span("db", db.dialect) as call:
+            response = query_cache.run(vars["query"], snapshot.versions, execute)
+            call["cache_hit"] = not executed
+            call["rows"] = response.rows_scanned
+        sql_memo.store(vars["question"], vars["chat_history"], snapshot.structure_checksum, vars["query"])
+        return response
+
+    return RunnablePassthrough.assign(response=run_sql)
+
+# Result -> natural language answer stage (built once per database connection)
+@st.cache_resource(show_spinner=False, hash_funcs={SQLDatabase: db_key})
+def get_answer_chain(db: SQLDatabase):
     template = """
     You are a data analyst at a company. You are interacting with a user who is asking you questions about the company's database.
     Based on the table schema below, question, sql query, and sql response, write a natural language response.
     <SCHEMA>{schema}</SCHEMA>
 
-    Conversation History: {chat_history}
+    Conversation History: {history}
     SQL Query: <SQL>{query}</SQL>
     User question: {question}
     SQL Response: {response}
     """
     prompt = ChatPromptTemplate.from_template(template)
-    llm = ChatGroq(model="mixtral-8x7b-32768", temperature=0)
-    chain = (
-        RunnablePassthrough.assign(query=sql_chain).assign(
-            schema=lambda _: db.get_table_info(),
-            response=lambda vars: db.run(vars["query"]),
-        )
+    llm = get_llm()
+    schema_cache = get_schema_cache(db)
+    return (
+        RunnablePassthrough.assign(schema=lambda vars: schema_cache.relevant(schema_search_text(vars)))
         | prompt
         | llm
         | StrOutputParser()
     )
-    return chain.invoke({
+
+# Get Response from SQL Chain in stages; returns (answer, sql, result, shape).
+# on_sql(guarded) runs once the SQL is generated and checked, before it is
+# executed; on_result(result, seconds) once the query has run. Scalar,
+# tabular and empty results skip the answer LLM call unless summarize is
+# set: answer is then their markdown and shape says how to render them.
+# shape is None when the LLM wrote the answer; write_stream (e.g.
+# st.write_stream) receives its tokens as they arrive and returns the text.
+def get_response(user_query: str, db: SQLDatabase, chat_history: list, compactor: HistoryCompactor = None,
+                 on_sql=None, on_result=None, write_stream=None, summarize: bool = False):
+    compactor = compactor or HistoryCompactor()
+    vars = get_query_chain(db).invoke({
         "question": user_query,
         "chat_history": chat_history,
+        "history": compactor.render(chat_history, user_query),
     })
+    if on_sql is not None:
+        on_sql(vars["guard"])
+
+    started = time.perf_counter()
+    vars = get_execute_chain(db).invoke(vars)
+    result = vars["response"]
+    if on_result is not None:
+        on_result(result, time.perf_counter() - started)
+
+    shape = classify(result, user_query)
+    if shape != INTERPRET and not summarize:
+        return to_markdown(result, shape), vars["query"], result, shape
+    answer_chain = get_answer_chain(db)
+    if write_stream is not None:
+        return write_stream(answer_chain.stream(vars)), vars["query"], result, None
+    return answer_chain.invoke(vars), vars["query"], result, None
+
+# Stage displays for get_response
+def show_sql(guarded):
+    st.code(guarded.sql, language="sql")
+    st.caption(guarded.describe())
+
+def show_result(result, seconds):
+    if not result.columns:
+        st.caption(f"Query ran in {seconds:.2f}s.")
+        return
+    rows = f"at least {result.rows_scanned}" if result.scan_truncated else str(result.rows_scanned)
+    st.caption(f"Query ran in {seconds:.2f}s and returned {rows} row(s).")
+    if not result.preview:
+        return
+    if result.rows_scanned == 1 and len(result.columns) == 1:
+        value = result.preview[0][0]
+        st.metric(result.columns[0], value if isinstance(value, (int, float)) else str(value))
+    else:
+        st.dataframe(pd.DataFrame(result.preview, columns=result.columns), hide_index=True)
 
 # Main Streamlit Application
 def main():
     load_dotenv()
     st.set_page_config(page_title="Chat with MySQL", page_icon=":speech_balloon:")
+    bind_session()
     st.title("Chat with MySQL")
 
     # Sidebar for Database Connection
@@ -113,11 +321,46 @@ def main():
                     st.session_state.db = db
                     st.success("Connected to database!")
 
+        if "db" in st.session_state:
+            schema_cache = get_schema_cache(st.session_state.db)
+            if st.button("Refresh schema"):
+                schema_cache.refresh()
+            metrics = schema_cache.metrics()
+            if "age_seconds" in metrics:
+                st.caption(
+                    f"Schema snapshot: {metrics['tables']} tables, {metrics['age_seconds']:.0f}s old, "
+                    f"built {metrics['builds']} time(s) in {metrics['last_build_seconds']:.2f}s, "
+                    f"{metrics['hits']} cache hit(s), {metrics['pruned_schema']} pruned prompt(s)."
+                )
+            query_stats = get_query_cache(st.session_state.db).stats()
+            st.caption(
+                f"Query cache: {query_stats['entries']} result(s), {query_stats['hits']} hit(s), "
+                f"{query_stats['misses']} miss(es)."
+            )
+            memo_stats = get_sql_memo(st.session_state.db).stats()
+            st.caption(
+                f"SQL memo: {memo_stats['entries']} question(s), "
+                f"{memo_stats['exact_hits'] + memo_stats['fuzzy_hits']} LLM call(s) skipped."
+            )
+            st.toggle(
+                "Always summarize results", key="always_summarize",
+                help="Also describe tables and single values in words (one more LLM call per question).",
+            )
+            pool = pool_metrics(st.session_state.db._engine)
+            if "size" in pool:
+                st.caption(
+                    f"Connection pool: {pool['checked_out']} in use, {pool['idle']} idle, "
+                    f"{pool['overflow']} overflow, capacity {pool['capacity']}."
+                )
+
     # Chat History Initialization
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = [
             AIMessage(content="Hello! I'm a SQL assistant. Ask me anything about your database."),
         ]
+    # Folds older turns into a summary so prompt size stays flat in long sessions
+    if "history_compactor" not in st.session_state:
+        st.session_state.history_compactor = HistoryCompactor()
     
     # Display Chat History
     for message in st.session_state.chat_history:
@@ -137,10 +380,26 @@ def main():
             st.markdown(user_query)
         
         with st.chat_message("AI"):
-            response = get_response(user_query, st.session_state.db, st.session_state.chat_history)
-            st.markdown(response)
+            # SQL, then execution time and preview, then the streamed answer
+            try:
+                response, sql, result, shape = get_response(
+                    user_query, st.session_state.db, st.session_state.chat_history, st.session_state.history_compactor,
+                    on_sql=show_sql, on_result=show_result, write_stream=st.write_stream,
+                    summarize=st.session_state.get("always_summarize", False),
+                )
+                # Scalars and tables were already shown by show_result
+                if shape == EMPTY:
+                    st.markdown(response)
+            except SQLGuardError as e:
+                response, sql = f"I did not run the query I came up with: {e}", e.sql
+                st.markdown(response)
+            except sqlalchemy.exc.DBAPIError as e:
+                response, sql = f"The database could not run the query: {e.orig}", None
+                st.markdown(response)
         
-        st.session_state.chat_history.append(AIMessage(content=response))
+        st.session_state.chat_history.append(AIMessage(content=response, additional_kwargs={"sql": sql}))
+
+    show_trace_panel()
 
 if __name__ == "__main__":
     main()
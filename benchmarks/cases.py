@@ -0,0 +1,127 @@
+import os
+import tempfile
+
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+from PIL import Image
+
+from src.backends import get_generative_model
+from src.chinook import create_chinook
+from src.dedup import fan_out, group_duplicates
+from src.gemini import generate_content
+from src.history import HistoryCompactor
+from src.packing import build_contents, generate_packed, pack
+from src.parallel import run_in_parallel
+from src.preprocess import prepare_image, prepare_images
+from src.scoring import score_images
+
+SLIDE_PROMPT = "Analyze this slide for layout, readability and visual hierarchy."
+
+
+def synthetic_images(count, size=(1920, 1080), seed=0):
+    '''
+    Slide-like RGB images: a gradient background, noise and a few blocks.
+    '''
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    images = []
+    for _ in range(count):
+        pixels = np.broadcast_to(gradient, (height, width, 3)).copy()
+        pixels += rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+        for _ in range(4):
+            x, y = rng.integers(0, width // 2), rng.integers(0, height // 2)
+            pixels[y:y + height // 4, x:x + width // 4] = rng.integers(0, 255, 3)
+        images.append(Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)))
+    return images
+
+
+def slide_deck(count, duplicate_every=4):
+    # Every duplicate_every-th slide repeats the previous one, as in real decks
+    unique = synthetic_images(count - count // duplicate_every, size=(1280, 720))
+    deck = []
+    for image in unique:
+        deck.append(image)
+        if len(deck) % duplicate_every == duplicate_every - 1 and len(deck) < count:
+            deck.append(image.copy())
+    return deck[:count]
+
+
+def image_scoring(size):
+    images = synthetic_images(size)
+    return (lambda: score_images(images)), size
+
+
+def preprocessing(size):
+    images = synthetic_images(size, size=(3000, 2000))
+    return (lambda: prepare_images(images)), size
+
+
+def prompt_assembly(size):
+    prepared = [prepare_image(image) for image in synthetic_images(size, size=(1280, 720))]
+    history = []
+    for turn in range(30):
+        history.append(HumanMessage(content=f"How many tracks are in genre {turn}?"))
+        history.append(AIMessage(content=f"There are {turn * 7} tracks.",
+                                 additional_kwargs={"sql": f"SELECT COUNT(*) FROM Track WHERE GenreId = {turn}"}))
+
+    def run():
+        sizes = [image.encoded_bytes for image in prepared]
+        for indices in pack(sizes, SLIDE_PROMPT):
+            build_contents(SLIDE_PROMPT, [prepared[i].blob for i in indices], [i + 1 for i in indices])
+        HistoryCompactor().render(history, "And for genre 31?")
+
+    return run, size
+
+
+def sql_chain(size):
+    import app
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-chinook-"), "chinook.sqlite")
+    db = app.get_database(f"sqlite:///{create_chinook(path)}")
+    counter = iter(range(10 ** 9))
+
+    def run():
+        # A new number each time so the SQL memo cannot answer for the LLM
+        batch = next(counter)
+        for question in range(size):
+            app.get_response(f"How many tracks does album {batch * size + question} have?", db, [], summarize=True)
+
+    return run, size
+
+
+def batch_analysis(size):
+    deck = slide_deck(size)
+    model = get_generative_model("gemini-pro-vision")
+
+    def run():
+        groups = group_duplicates(deck)
+        prepared = prepare_images([deck[group[0]] for group in groups])
+        results = run_in_parallel(lambda image: generate_content(model, [SLIDE_PROMPT, image.blob]).text, prepared)
+        return fan_out(results, groups, len(deck))
+
+    return run, size
+
+
+def packed_batch_analysis(size):
+    deck = slide_deck(size)
+    model = get_generative_model("gemini-pro-vision")
+
+    def run():
+        groups = group_duplicates(deck)
+        prepared = prepare_images([deck[group[0]] for group in groups])
+        _, sections = generate_packed(model, SLIDE_PROMPT, prepared, [group[0] + 1 for group in groups])
+        return fan_out(sections, groups, len(deck))
+
+    return run, size
+
+
+# name -> (factory, default number of items per run)
+CASES = {
+    "image_scoring": (image_scoring, 16),
+    "preprocessing": (preprocessing, 8),
+    "prompt_assembly": (prompt_assembly, 24),
+    "sql_chain": (sql_chain, 5),
+    "batch_analysis": (batch_analysis, 16),
+    "packed_batch_analysis": (packed_batch_analysis, 16),
+}
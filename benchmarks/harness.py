@@ -0,0 +1,89 @@
+import json
+import os
+import time
+import tracemalloc
+
+# Metrics compared against a baseline, and whether lower is better
+COMPARED = {"p50_ms": True, "p95_ms": True, "throughput": False, "peak_kb": True}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def measure(name, run, items, iterations=10, warmup=1):
+    '''
+    Time run() over iterations after warmup calls. run processes items
+    items per call, which gives the throughput. Peak memory comes from one
+    extra call under tracemalloc, so tracing does not skew the timings.
+    '''
+    for _ in range(warmup):
+        run()
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "name": name,
+        "iterations": iterations,
+        "items": items,
+        "throughput": items * iterations / total if total else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+
+def save_baseline(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({result["name"]: result for result in results}, f, indent=2, sort_keys=True)
+
+
+def compare(results, path, tolerance=0.2):
+    '''
+    Regressions against the baseline at path: (case, metric, baseline, now)
+    for every metric that got worse by more than tolerance (a fraction).
+    '''
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = []
+    for result in results:
+        before = baseline.get(result["name"])
+        if before is None:
+            continue
+        for metric, lower_is_better in COMPARED.items():
+            old, new = before.get(metric), result[metric]
+            if not old:
+                continue
+            change = (new - old) / old if lower_is_better else (old - new) / old
+            if change > tolerance:
+                regressions.append((result["name"], metric, old, new))
+    return regressions
+
+
+def format_table(results):
+    header = f"{'case':<22}{'items':>7}{'items/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>11}"
+    lines = [header, "-" * len(header)]
+    for result in results:
+        lines.append(
+            f"{result['name']:<22}{result['items']:>7}{result['throughput']:>11.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['peak_kb']:>11.0f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,60 @@
+'''
+End-to-end benchmarks on the local backends (no API keys or MySQL needed).
+
+    python -m benchmarks.run                       # all cases
+    python -m benchmarks.run sql_chain --iterations 20
+    python -m benchmarks.run --save-baseline       # store results as the baseline
+    python -m benchmarks.run --compare             # flag regressions, exit 1 if any
+
+Baselines are machine specific, so none are shipped with the repo.
+'''
+import argparse
+import os
+import sys
+
+# Must be set before src modules read their configuration
+os.environ.setdefault("LLM_BACKEND", "stub")
+os.environ.setdefault("LLM_STUB_LATENCY", "fixed:0.05")
+os.environ.setdefault("LLM_STUB_CHUNK_LATENCY", "0")
+os.environ.setdefault("GEMINI_CACHE_DISABLED", "1")
+
+from benchmarks.cases import CASES  # noqa: E402
+from benchmarks.harness import compare, format_table, measure, save_baseline  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(".cache", "benchmarks", "baseline.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("cases", nargs="*", choices=[[]] + list(CASES), help="cases to run (default: all)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--size", type=int, help="items per run instead of each case's default")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown as a fraction (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(format_table([]), flush=True)
+    for name in args.cases or list(CASES):
+        factory, default_size = CASES[name]
+        run, items = factory(args.size or default_size)
+        results.append(measure(name, run, items, args.iterations, args.warmup))
+        print(format_table(results[-1:]).splitlines()[-1], flush=True)
+
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for case, metric, old, new in regressions:
+            print(f"REGRESSION {case} {metric}: {old:.1f} -> {new:.1f}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,100 +1,106 @@
-import google.generativeai as genai
 from dotenv import load_dotenv
 import streamlit as st
-import os
 import time
-from PIL import Image, ImageStat
 import numpy as np
-import cv2
-import random
 import re
+from src.parallel import run_in_parallel
+from src.gemini import generate_content
+from src.backends import get_generative_model
+from src.prompts import prompted_model, register_prompt
+from src.trace_panel import bind_session, show_trace_panel
+from src.image_pipeline import DecodedImage
+from src.scoring import measure_image, rate_measurements
+from src.preprocess import describe_savings, open_upload, prepare_image
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Define and initialize the model variables
-model = genai.GenerativeModel('gemini-pro')
-vision_model = genai.GenerativeModel('gemini-pro-vision')
+vision_model = get_generative_model('gemini-pro-vision')
 
-# Function to load OpenAI model and get responses
+# Function to stream the Gemini answer into the page and time it
 def get_gemini_response(question):
-    full_input = f"{UX_DESIGN_PROMPT}\n{question}"
-    with st.spinner("AI is typing..."):
-        time.sleep(3)  # Simulate model response time
-        response = model.generate_content(full_input)
-    return response.text
-
-# Define Scoring Functions
-def calculate_image_quality_score(analysis_result, image_path):
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    laplacian_var = cv2.Laplacian(image, cv2.CV_64F).var()
-    if laplacian_var > 300:
-        return 5
-    elif laplacian_var > 100:
-        return 3
-    else:
-        return 1
-
-def calculate_accessibility_score(analysis_result, image_path):
-    image = Image.open(image_path)
-    stat = ImageStat.Stat(image)
-    brightness = stat.mean[0]
-    if brightness > 192:
-        return 5
-    elif brightness > 128:
-        return 3
-    else:
-        return 1
+    assistant = prompted_model('gemini-pro', "UX Design Assistant")  # Carries UX_DESIGN_PROMPT
+    timings = {}
+    started = time.perf_counter()
+
+    def stream_chunks():
+        for chunk in generate_content(assistant, question, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunk without text parts (e.g. safety metadata only)
+            if "time_to_first_token" not in timings:
+                timings["time_to_first_token"] = time.perf_counter() - started
+            yield text
+
+    response_text = st.write_stream(stream_chunks())
+    timings["total"] = time.perf_counter() - started
+    return response_text, timings
+
+# General analyze_images function; prompt_name selects a registered fixed prompt
+def analyze_images(images, prompt="", prompt_name=None):
+    progress_bar = st.progress(0)
+    model = prompted_model('gemini-pro-vision', prompt_name)
 
-def calculate_visual_hierarchy_score(analysis_result, image_path):
-    return random.randint(1, 5)
+    # Runs on a worker thread: no Streamlit calls in here
+    def analyze(image):
+        decoded = DecodedImage.from_pil(image)
+        prepared = prepare_image(decoded.to_pil(), original_bytes=image.info.get("upload_bytes"))
+        response = generate_content(model, [prompt, prepared.blob] if prompt else prepared.blob)
+        return response.text, measure_image(decoded), prepared
 
-def calculate_rating(analysis_result, image_path):
-    quality_score = calculate_image_quality_score(analysis_result, image_path)
-    accessibility_score = calculate_accessibility_score(analysis_result, image_path)
-    hierarchy_score = calculate_visual_hierarchy_score(analysis_result, image_path)
+    def update_progress(done, total):
+        progress_bar.progress(int(100 * done / total))
 
-    overall_rating = (quality_score + accessibility_score + hierarchy_score) / 3
-    return round(overall_rating, 1)
+    with st.spinner(f"Analyzing {len(images)} image(s)..."):
+        # A failed image gets an error line; the others keep their results
+        analyses = run_in_parallel(analyze, images, on_progress=update_progress, return_exceptions=True)
+
+    done = [analysis for analysis in analyses if not isinstance(analysis, Exception)]
+    ratings = iter([])
+    if done:
+        st.caption(describe_savings(prepared for _, _, prepared in done))
+        sharpness, brightness = zip(*(measurements for _, measurements, _ in done))
+        ratings = iter(rate_measurements(sharpness, brightness)["overall"])
 
-# General analyze_images function
-def analyze_images(images, prompt):
     results = []
-    progress_bar = st.progress(0)
-    progress_step = 100 // len(images)
-    for i, image in enumerate(images):
-        with st.spinner(f"Analyzing image {i+1}..."):
-            temp_img_path = f"temp_image_{i}.png"
-            image.save(temp_img_path)
-            response = vision_model.generate_content([prompt, Image.open(temp_img_path)])
-            results.append(response.text)
-            rating = calculate_rating(response.text, temp_img_path)
-            results.append(f"UX Design Rating: {rating}/5")
-            progress_bar.progress(progress_step * (i + 1))
-            os.remove(temp_img_path)
+    for idx, analysis in enumerate(analyses):
+        if isinstance(analysis, Exception):
+            results.append(f"An error occurred for image {idx + 1}: {str(analysis)}")
+            continue
+        results.append(analysis[0])
+        results.append(f"UX Design Rating: {next(ratings):.1f}/5")
     return results
 
 # Specific function for Image Headline Analysis
 def analyze_headline_images(images, criteria):
-    results = []
     progress_bar = st.progress(0)
-    progress_step = 100 // len(images)
-    for i, image in enumerate(images):
-        with st.spinner(f"Analyzing image headline {i+1}..."):
-            temp_img_path = f"temp_image_{i}.png"
-            image.save(temp_img_path)
-            prompts = [image_headline_analysis_options[crit] for crit in criteria]
-            combined_prompt = " ".join(prompts)
-            response = vision_model.generate_content([combined_prompt, Image.open(temp_img_path)])
-            results.append(response.text)
-            progress_bar.progress(progress_step * (i + 1))
-            os.remove(temp_img_path)
-    return results
+    prompts = [image_headline_analysis_options[crit] for crit in criteria]
+    combined_prompt = " ".join(prompts)
+
+    def analyze(image):
+        prepared = prepare_image(image)
+        response = generate_content(vision_model, [combined_prompt, prepared.blob])
+        return response.text, prepared
+
+    def update_progress(done, total):
+        progress_bar.progress(int(100 * done / total))
+
+    with st.spinner(f"Analyzing {len(images)} image headline(s)..."):
+        analyses = run_in_parallel(analyze, images, on_progress=update_progress, return_exceptions=True)
+
+    done = [analysis for analysis in analyses if not isinstance(analysis, Exception)]
+    if done:
+        st.caption(describe_savings(prepared for _, prepared in done))
+    return [f"An error occurred for image {idx + 1}: {str(analysis)}" if isinstance(analysis, Exception) else analysis[0]
+            for idx, analysis in enumerate(analyses)]
 
 # Define UX design prompt
 UX_DESIGN_PROMPT = """
 You are a friendly, kind, helpful, and highly knowledgeable world-best UX design assistant, trained on a vast dataset of UX design articles, resources, and best practices to tackle any kind of design challenge. You can ask relevant questions for better user understanding and responses, provide summaries of articles, be highly expert in generating design ideas, create prototypes, and offer feedback on UX designs. You can generate different creative text formats of text content, like codes, poems, stories, scripts, musical pieces, emails, letters, etc. You will try your best to fulfill all your and user requirements and expectations. You do not respond as 'User' or pretend to be 'User'. You only respond once as 'Assistant'.
 """
+register_prompt("UX Design Assistant", UX_DESIGN_PROMPT)
 
 # App Configuration
 st.set_page_config(
@@ -102,6 +108,7 @@ st.set_page_config(
     page_icon=":art:",
     layout="wide"
 )
+bind_session()
 
 # Theme customization
 st.markdown("""
@@ -139,9 +146,13 @@ with main_container:
     submit_button = st.button("Send")
 
     if submit_button:
-        with st.spinner("AI is thinking..."):
-            response_text = get_gemini_response(user_question)
-        st.write("AI:", response_text)
+        st.write("AI:")
+        response_text, timings = get_gemini_response(user_question)
+        first_token = timings.get("time_to_first_token")
+        st.caption(
+            (f"First token after {first_token:.2f}s, " if first_token is not None else "")
+            + f"complete after {timings['total']:.2f}s."
+        )
 
 # Analysis Options and Headline Analysis Options
 analysis_options = { 
@@ -244,41 +255,8 @@ image_headline_analysis_options = {
     "Use of Power Words": "Does the headline include power words or action verbs? Score (1-5)"
 }
 
-# Image Analysis Features
-st.header("Image Analysis")
-analysis_choice = st.selectbox("Select Analysis Type:", list(analysis_options.keys()))
-col1, col2 = st.columns(2)
-
-with col1:
-    upload_files = st.file_uploader("Upload UX Design Images:", type=["jpg", "jpeg", "png", "webp"], accept_multiple_files=True)
-    images = []
-    if upload_files:
-        for uploaded_file in upload_files:
-            image = Image.open(uploaded_file)
-            images.append(image)
-        if len(upload_files) > 1:
-            st.write("Image Gallery:")
-            cols = st.columns(len(upload_files))
-            for idx, uploaded_file in enumerate(upload_files):
-                cols[idx].image(uploaded_file, width=150)
-        else:
-            st.image(upload_files[0], caption="Uploaded Image", width=300)
-
-with col2:
-    if analysis_choice == "Image Headline Analysis":
-        image_headline_options = st.multiselect("Select Criteria:", list(image_headline_analysis_options.keys()))
-        input_text = st.text_area("Input Prompt:", height=150, help="Enter additional information.")
-        analyze_headline_button = st.button("Analyze Headline")
-        default_analyze_button = st.button("Default Headline Analysis")
-        if analyze_headline_button and images and image_headline_options:
-            selected_prompt = [image_headline_analysis_options[crit] for crit in image_headline_options]
-            prompt = " ".join(selected_prompt) + " " + input_text if input_text else " ".join(selected_prompt)
-            responses = analyze_headline_images(images, image_headline_options)
-            st.subheader("Analysis Results:")
-            for response in responses:
-                st.write(response)
-        elif default_analyze_button and images:
-            prompt = """Image Headline Analysis
+# Rubric for the "Default Headline Analysis" button
+DEFAULT_HEADLINE_PROMPT = """Image Headline Analysis
 Headline for Evaluation: [Insert Headline Here]
 
 Analyze the following aspects, providing a score and explanation for each point:
@@ -377,7 +355,47 @@ Visual Focus: Emphasizes analysis of the image itself, not just textual headline
 Actionable Feedback: Provides alternative headline suggestions.
 SEO Awareness: Maintains focus on keywords for optimization.
 **Note:** If a point is not applicable to the image, the model should respond with "Score (N/A): Not applicable for this headline" and still provide a short explanation as to why it's not applicable."""
-            responses = analyze_images(images, prompt)
+
+# Fixed prompts live on the model; callers pass only their own text and images
+for name, text in analysis_options.items():
+    register_prompt(name, text)
+register_prompt("Default Headline Analysis", DEFAULT_HEADLINE_PROMPT)
+
+# Image Analysis Features
+st.header("Image Analysis")
+analysis_choice = st.selectbox("Select Analysis Type:", list(analysis_options.keys()))
+col1, col2 = st.columns(2)
+
+with col1:
+    upload_files = st.file_uploader("Upload UX Design Images:", type=["jpg", "jpeg", "png", "webp"], accept_multiple_files=True)
+    images = []
+    if upload_files:
+        for uploaded_file in upload_files:
+            image = open_upload(uploaded_file)
+            images.append(image)
+        if len(upload_files) > 1:
+            st.write("Image Gallery:")
+            cols = st.columns(len(upload_files))
+            for idx, uploaded_file in enumerate(upload_files):
+                cols[idx].image(uploaded_file, width=150)
+        else:
+            st.image(upload_files[0], caption="Uploaded Image", width=300)
+
+with col2:
+    if analysis_choice == "Image Headline Analysis":
+        image_headline_options = st.multiselect("Select Criteria:", list(image_headline_analysis_options.keys()))
+        input_text = st.text_area("Input Prompt:", height=150, help="Enter additional information.")
+        analyze_headline_button = st.button("Analyze Headline")
+        default_analyze_button = st.button("Default Headline Analysis")
+        if analyze_headline_button and images and image_headline_options:
+            selected_prompt = [image_headline_analysis_options[crit] for crit in image_headline_options]
+            prompt = " ".join(selected_prompt) + " " + input_text if input_text else " ".join(selected_prompt)
+            responses = analyze_headline_images(images, image_headline_options)
+            st.subheader("Analysis Results:")
+            for response in responses:
+                st.write(response)
+        elif default_analyze_button and images:
+            responses = analyze_images(images, prompt_name="Default Headline Analysis")
             st.subheader("Default Analysis Results:")
             for response in responses:
                 st.write(response)
@@ -387,9 +405,7 @@ SEO Awareness: Maintains focus on keywords for optimization.
         custom_analyze_button = st.button("Analyze Designs (Custom)")
 
         if analyze_button and images:
-            selected_prompt = analysis_options.get(analysis_choice, "")
-            prompt = selected_prompt + " " + input_text if input_text else selected_prompt
-            responses = analyze_images(images, prompt)
+            responses = analyze_images(images, input_text, prompt_name=analysis_choice)
             st.subheader("Analysis Results:")
             for response in responses:
                 st.write(response)
@@ -404,6 +420,8 @@ SEO Awareness: Maintains focus on keywords for optimization.
             else:
                 st.warning("Please enter a custom prompt for analysis.")
 
+show_trace_panel()
+
 # Run the Streamlit app
 if __name__ == "__main__":
     st.write("Streamlit app is running...")
@@ -4,6 +4,14 @@ from PIL import Image, UnidentifiedImageError
 import google.generativeai as genai
 import os
 import logging
+from src.parallel import run_in_parallel
+from src.gemini import generate_content
+from src.prompts import prompted_model, register_prompt
+from src.chat_session import get_analysis_chat
+from src.trace_panel import bind_session, show_trace_panel
+from src.preprocess import describe_savings, open_upload, prepare_images
+from src.dedup import describe_duplicates, fan_out, group_duplicates
+from src.packing import generate_packed
 
 # Configure logging
 logging.basicConfig(filename='app.log', level=logging.ERROR)
@@ -14,20 +22,53 @@ load_dotenv()
 # Configure Google Generative AI API
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
-def get_gemini_response(input, images):
+def get_gemini_response(input, images, prompt_name=None):
+    model = prompted_model('gemini-pro-vision', prompt_name)
+
+    def generate(image):
+        if input != "":
+            response = generate_content(model, [input, image])
+        else:
+            response = generate_content(model, image)
+        return response.text
+
+    # Rate-limited calls are retried per slide; a slide that still fails
+    # gets an error message without stopping the rest of the batch
+    responses = []
+    for index, result in enumerate(run_in_parallel(generate, images, return_exceptions=True), start=1):
+        if isinstance(result, Exception):
+            logging.error(f"An error occurred for image {index}: {str(result)}")
+            result = f"An error occurred: {str(result)}"
+        responses.append(result)
+    return responses
+
+def get_packed_gemini_response(input, prepared, numbers, prompt_name=None):
     try:
-        model = genai.GenerativeModel('gemini-pro-vision')
-        responses = []
-        for image in images:
-            if input != "":
-                response = model.generate_content([input, image])
-            else:
-                response = model.generate_content(image)
-            responses.append(response.text)
-        return responses
+        model = prompted_model('gemini-pro-vision', prompt_name)
+        return generate_packed(model, input, prepared, numbers)
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
-        return [f"An error occurred: {str(e)}"]
+        return [f"An error occurred: {str(e)}"], [None] * len(prepared)
+
+def analyze_slides(input, images, packed=False, prompt_name=None):
+    # Only one slide per group of near-duplicates goes to the model
+    groups = group_duplicates(images)
+    duplicates = describe_duplicates(groups)
+    if duplicates:
+        st.info(f"Skipped {len(images) - len(groups)} duplicate slide(s):\n{duplicates}")
+    prepared = prepare_images([images[group[0]] for group in groups])
+    st.caption(describe_savings(prepared))
+
+    if packed:
+        # Several slides per request so the model can compare them
+        overviews, responses = get_packed_gemini_response(input, prepared, [group[0] + 1 for group in groups], prompt_name)
+        st.subheader("Cross-Slide Analysis:")
+        for overview in overviews:
+            st.write(overview)
+        responses = [response or "No separate section for this slide; see the cross-slide analysis." for response in responses]
+    else:
+        responses = get_gemini_response(input, [p.blob for p in prepared], prompt_name)
+    return fan_out(responses, groups, len(images))
 
 
 # Define analysis options dictionary
@@ -41,23 +82,33 @@ analysis_options = {
         "decoding success": "Analyze the presentation style in comparison to similar high-performing presentations within the same field. Identify specific elements (e.g., visuals, engagement, flow) that contribute to their effectiveness and suggest how you can incorporate these best practices to elevate your own presentation delivery."
     }
 
-def handle_button_click(input, images):
+# Attached to the model, so each request only names the slides
+for name, text in analysis_options.items():
+    register_prompt(name, text)
+
+# Prompts that reason across the whole deck rather than one slide
+cross_slide_options = {
+    "Focus on Template-Specific Considerations",
+    "Focus on Visual Features and Layout Similarities",
+}
+
+def handle_button_click(input, images, packed=False):
     if input in analysis_options:
-        prompt = analysis_options[input]
-        responses = get_gemini_response(prompt, images)
+        # The option's prompt is attached to the model; no per-call text
+        responses = analyze_slides("", images, packed, prompt_name=input)
     else:
         return ["Invalid prompt selected. Please choose a valid option."]
 
     return responses
 
-def start_gemini_chat(history=[]):
-    model = genai.GenerativeModel('gemini-pro')
-    return model.start_chat(history=history)
+def _results_text(responses):
+    return "\n\n".join(f"Image {idx + 1}: {response}" for idx, response in enumerate(responses))
 
 def main():
-    chat = None
     images = []
     st.set_page_config(page_title="Gemini Image Demo", page_icon="🦄", layout="wide")
+    bind_session()
+    chat = get_analysis_chat()  # Kept in session state across reruns
     st.title("AI Image Analysis")
     st.markdown("---")
 
@@ -66,6 +117,8 @@ def main():
     with col1:
         st.header("Choose an Analysis Option")
         input_prompt = st.selectbox("Select Analysis:", list(analysis_options.keys()))
+        packed = st.checkbox("Analyze slides together", value=input_prompt in cross_slide_options,
+                             help="Send several slides per request so the model can compare them across the deck.")
         input_text = st.text_input("Input Custom Prompt:", key="input", help="Enter a custom prompt for analysis.")
         submit_custom = st.button("Analyze Custom Prompt", help="Click here to analyze the custom prompt")
         st.subheader("Upload Image(s)")
@@ -75,7 +128,7 @@ def main():
             images.clear()  # Clear existing images
             for uploaded_file in upload_files:
                 try:
-                    image = Image.open(uploaded_file)
+                    image = open_upload(uploaded_file)
                     images.append(image)
                     st.image(image, caption="Uploaded Image", use_column_width=True)
                 except UnidentifiedImageError:
@@ -85,19 +138,21 @@ def main():
 
         if submit:
             if input_prompt and images:
-                responses = handle_button_click(input_prompt, images)
+                responses = handle_button_click(input_prompt, images, packed)
                 for idx, response in enumerate(responses):
                     st.subheader(f"Analysis Result for Image {idx + 1}:")
                     st.write(response)
+                chat.set_context(_results_text(responses))
             else:
                 st.warning("Please select an analysis option and upload image(s).")
         if submit_custom:
             if input_text and images:
-                responses = get_gemini_response(input_text, images)  # Get responses for the images
+                responses = analyze_slides(input_text, images, packed)  # Get responses for the images
                 st.subheader("Custom Analysis Result:")
                 for idx, response in enumerate(responses):
                     # Convert each response to text and display it
                     st.write(f"Response for Image {idx + 1}: {str(response)}")
+                chat.set_context(_results_text(responses))
             else:
                 st.warning("Please enter a custom prompt and upload an image.")
 
@@ -110,28 +165,23 @@ def main():
         st.markdown("---")
         st.header("Chat About the Results")
 
-        if chat is None:
-            st.info("Initializing the chat... Please wait.")
-            chat = start_gemini_chat()
-            st.info("Chat initialized. You can now start chatting with Gemini.")
-
-        if chat is not None:
-            chat_input = st.text_input("Chat Input:", key="chat_input")
-            send_message = st.button("Send")
-
-            if send_message:
-                if chat_input:
-                    response = chat.send_message(chat_input, stream=True)
-                    st.subheader("Gemini's Response:")
-                    for chunk in response:
-                        st.write(chunk.text)
-                else:
-                    st.warning("Please input a message to chat.")
-        else:
-            st.warning("Please wait... Initializing the chat.")
+        for turn in chat.transcript:
+            st.write(f"{'You' if turn['sender'] == 'user' else 'Gemini'}: {turn['text']}")
+
+        chat_input = st.text_input("Chat Input:", key="chat_input")
+        send_message = st.button("Send")
+
+        if send_message:
+            if chat_input:
+                st.subheader("Gemini's Response:")
+                st.write_stream(chat.send(chat_input))
+            else:
+                st.warning("Please input a message to chat.")
 
     st.markdown("---")
     st.markdown("©2024 @Hotmailer. All rights reserved.")
 
+    show_trace_panel()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,375 @@
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from src.rate_limit import RETRY_ATTEMPTS, get_rate_limiter
+from src.rate_limit_callbacks import ChatRateLimiter, RateLimitCallbackHandler
+from src.response_cache import make_key
+
+# live: real Gemini/Groq calls; stub: local deterministic answers;
+# record: real calls saved to LLM_RECORD_DIR; replay: saved answers only
+LLM_BACKEND = os.getenv("LLM_BACKEND", "live").lower()
+# Simulated time to first token: fixed:S, uniform:A,B, normal:MEAN,SD or lognormal:MEDIAN,SIGMA (seconds)
+LLM_STUB_LATENCY = os.getenv("LLM_STUB_LATENCY", "lognormal:0.8,0.4")
+# Simulated delay between streamed chunks (seconds)
+LLM_STUB_CHUNK_LATENCY = float(os.getenv("LLM_STUB_CHUNK_LATENCY", "0.02"))
+LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", "0"))
+LLM_RECORD_DIR = os.getenv("LLM_RECORD_DIR", os.path.join(".cache", "recordings"))
+# mysql: connect with the sidebar settings; chinook: local SQLite stand-in
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+
+BACKENDS = ("live", "stub", "record", "replay")
+STUB_WORDS = (
+    "layout contrast hierarchy spacing typography colour balance alignment readability emphasis "
+    "headline image audience slide message structure clarity focus detail consistency"
+).split()
+CHUNK_WORDS = 8
+
+
+class LatencyModel:
+    '''
+    Seeded latency distribution parsed from a spec such as "lognormal:0.8,0.4".
+    '''
+
+    def __init__(self, spec=LLM_STUB_LATENCY, seed=LLM_STUB_SEED):
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(arg) for arg in args.split(",") if arg.strip()]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == "fixed":
+                value = self.args[0] if self.args else 0.0
+            elif self.kind == "uniform":
+                value = self._random.uniform(self.args[0], self.args[1])
+            elif self.kind == "normal":
+                value = self._random.gauss(self.args[0], self.args[1])
+            else:
+                value = self._random.lognormvariate(math.log(self.args[0]), self.args[1])
+        return max(value, 0.0)
+
+
+class Recordings:
+    '''
+    Responses keyed by request hash, stored as JSON lines in directory/name.
+    '''
+
+    def __init__(self, name, directory=LLM_RECORD_DIR):
+        self.path = os.path.join(directory, name)
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["text"]
+
+    def get(self, key):
+        if key not in self._entries:
+            raise LookupError(f"No recorded response for request {key[:12]} in {self.path}")
+        return self._entries[key]
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "text": text}) + "\n")
+
+
+_recordings = {}
+_recordings_lock = threading.Lock()
+
+
+def get_recordings(name):
+    with _recordings_lock:
+        if name not in _recordings:
+            _recordings[name] = Recordings(name)
+        return _recordings[name]
+
+
+def stub_text(key, words=60):
+    '''
+    Deterministic filler text for a request hash.
+    '''
+    rng = random.Random(key)
+    sentences = []
+    while words > 0:
+        count = min(words, rng.randint(6, 14))
+        sentence = " ".join(rng.choice(STUB_WORDS) for _ in range(count))
+        sentences.append(sentence.capitalize() + ".")
+        words -= count
+    return " ".join(sentences)
+
+
+def _chunks(text):
+    words = text.split(" ")
+    return [" ".join(words[i:i + CHUNK_WORDS]) + (" " if i + CHUNK_WORDS < len(words) else "")
+            for i in range(0, len(words), CHUNK_WORDS)]
+
+
+# Gemini
+
+
+class LocalChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class LocalResponse:
+    '''
+    GenerateContentResponse look-alike. With stream=True, iterating yields
+    chunks with the simulated first-token and per-chunk delays; otherwise the
+    delays have been spent by the time it is returned.
+    '''
+
+    def __init__(self, text, first_token=0.0, chunk_delay=0.0, stream=False):
+        self.text = text
+        self.from_cache = False
+        self._first_token = first_token
+        self._chunk_delay = chunk_delay
+        self._stream = stream
+        if not stream:
+            time.sleep(first_token + chunk_delay * max(len(_chunks(text)) - 1, 0))
+
+    def __iter__(self):
+        chunks = _chunks(self.text)
+        if self._stream:
+            time.sleep(self._first_token)
+        for index, chunk in enumerate(chunks):
+            if self._stream and index:
+                time.sleep(self._chunk_delay)
+            yield LocalChunk(chunk)
+
+    def resolve(self):
+        pass
+
+
+class RecordingStream:
+    # Passes a live stream through and records its text once it is consumed
+    def __init__(self, response, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+
+    def __iter__(self):
+        parts = []
+        for chunk in self._response:
+            try:
+                parts.append(chunk.text)
+            except ValueError:
+                pass
+            yield chunk
+        self._on_complete("".join(parts))
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class LocalGenerativeModel:
+    '''
+    Drop-in for genai.GenerativeModel in the stub, record and replay backends.
+    '''
+
+    def __init__(self, model_name, backend, inner=None, latency=None, chunk_delay=LLM_STUB_CHUNK_LATENCY, **kwargs):
+        self.model_name = model_name if "/" in model_name else f"models/{model_name}"
+        self.backend = backend
+        self._inner = inner
+        self._generation_config = kwargs.get("generation_config") or getattr(inner, "_generation_config", None)
+        self._system_instruction = kwargs.get("system_instruction")
+        self._latency = latency or LatencyModel()
+        self._chunk_delay = chunk_delay
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        key = make_key([self._system_instruction, contents], self.model_name,
+                       kwargs.get("generation_config") or self._generation_config)
+        if self.backend == "record":
+            recordings = get_recordings("gemini.jsonl")
+            response = self._inner.generate_content(contents, stream=stream, **kwargs)
+            if stream:
+                return RecordingStream(response, lambda text: recordings.put(key, text))
+            recordings.put(key, response.text)
+            return response
+        if self.backend == "replay":
+            text = get_recordings("gemini.jsonl").get(key)
+        else:
+            text = stub_text(key)
+        return LocalResponse(text, self._latency.sample(), self._chunk_delay, stream)
+
+    def start_chat(self, history=None):
+        return LocalChatSession(self, history)
+
+
+class LocalChatSession:
+    '''
+    Minimal ChatSession for LocalGenerativeModel: the whole history is sent
+    with every message, as the real client does.
+    '''
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, **kwargs):
+        message = {"role": "user", "parts": content if isinstance(content, list) else [content]}
+        response = self.model.generate_content(self.history + [message], stream=stream, **kwargs)
+        if stream:
+            return _ChatStream(self, message, response)
+        self.history += [message, {"role": "model", "parts": [response.text]}]
+        return response
+
+
+class _ChatStream:
+    def __init__(self, session, message, response):
+        self._session = session
+        self._message = message
+        self._response = response
+        self.text = ""
+
+    def __iter__(self):
+        parts = []
+        for chunk in self._response:
+            parts.append(chunk.text)
+            yield chunk
+        self.text = "".join(parts)
+        self._session.history += [self._message, {"role": "model", "parts": [self.text]}]
+
+    def resolve(self):
+        for _ in self:
+            pass
+
+
+def get_generative_model(model_name, backend=None, **kwargs):
+    '''
+    genai.GenerativeModel for the live backend, otherwise a local stand-in.
+    '''
+    backend = (backend or LLM_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"LLM_BACKEND must be one of {', '.join(BACKENDS)}, not {backend}")
+    if backend in ("live", "record"):
+        import google.generativeai as genai
+        model = genai.GenerativeModel(model_name, **kwargs)
+        if backend == "live":
+            return model
+        return LocalGenerativeModel(model.model_name, backend, inner=model, **kwargs)
+    return LocalGenerativeModel(model_name, backend, **kwargs)
+
+
+# Groq / LangChain chat models
+
+SCHEMA_TABLE = re.compile(r"CREATE TABLE\s+[`\"\[]?(\w+)", re.IGNORECASE)
+
+
+def stub_chat_text(prompt, key):
+    '''
+    SQL for prompts that end asking for a query (a simple, valid query over a
+    table named in the prompt's schema), otherwise filler text.
+    '''
+    if prompt.rstrip().endswith("SQL Query:"):
+        tables = SCHEMA_TABLE.findall(prompt)
+        if tables:
+            rng = random.Random(key)
+            table = rng.choice(sorted(set(tables)))
+            return rng.choice([
+                f"SELECT COUNT(*) AS total FROM {table}",
+                f"SELECT * FROM {table} LIMIT 10",
+            ])
+        return "SELECT 1"
+    return stub_text(key, words=40)
+
+
+class LocalChatModel(BaseChatModel):
+    '''
+    LangChain chat model for the stub, record and replay backends. record
+    wraps the live model in inner.
+    '''
+
+    model_name: str
+    backend: str = "stub"
+    inner: Optional[Any] = None
+    latency_spec: str = LLM_STUB_LATENCY
+    chunk_delay: float = LLM_STUB_CHUNK_LATENCY
+    _latency_model: Optional[LatencyModel] = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self):
+        return f"local-{self.backend}"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": self.model_name, "backend": self.backend}
+
+    def _latency(self):
+        if self._latency_model is None:
+            self._latency_model = LatencyModel(self.latency_spec)
+        return self._latency_model
+
+    def _answer(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        key = hashlib.sha256(f"{self.model_name}\0{prompt}".encode("utf-8")).hexdigest()
+        if self.backend == "record":
+            text = self.inner.invoke(messages).content
+            get_recordings("chat.jsonl").put(key, text)
+            return text, False
+        if self.backend == "replay":
+            return get_recordings("chat.jsonl").get(key), True
+        return stub_chat_text(prompt, key), True
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, simulated = self._answer(messages)
+        if simulated:
+            time.sleep(self._latency().sample() + self.chunk_delay * max(len(_chunks(text)) - 1, 0))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, simulated = self._answer(messages)
+        if simulated:
+            time.sleep(self._latency().sample())
+        for index, chunk in enumerate(_chunks(text)):
+            if simulated and index:
+                time.sleep(self.chunk_delay)
+            generation = ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk, chunk=generation)
+            yield generation
+
+
+def get_chat_model(model, temperature=0, http_client=None, backend=None, callbacks=None):
+    '''
+    ChatGroq for the live backend, otherwise a LocalChatModel.
+
+    Calls wait on the process-wide Groq limiter for the model; the Groq
+    client retries rate-limited calls with jittered backoff.
+    '''
+    backend = (backend or LLM_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"LLM_BACKEND must be one of {', '.join(BACKENDS)}, not {backend}")
+    # Stub and replay models have no provider quota unless RATE_LIMITS sets one
+    limiter = get_rate_limiter("groq" if backend in ("live", "record") else "local", model)
+    callbacks = [RateLimitCallbackHandler(limiter), *(callbacks or [])]
+    if backend in ("live", "record"):
+        from langchain_groq import ChatGroq
+        llm = ChatGroq(
+            model=model, temperature=temperature, http_client=http_client, max_retries=RETRY_ATTEMPTS,
+            rate_limiter=ChatRateLimiter(limiter), callbacks=callbacks if backend == "live" else None,
+        )
+        if backend == "live":
+            return llm
+        return LocalChatModel(model_name=model, backend=backend, inner=llm, callbacks=callbacks)
+    return LocalChatModel(model_name=model, backend=backend, callbacks=callbacks,
+                          rate_limiter=ChatRateLimiter(limiter))
@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+import streamlit as st
+
+from src.backends import get_generative_model
+from src.gemini import send_message
+
+# Question/answer pairs kept after the seeded context
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "10"))
+# Longest analysis text used to seed a chat
+CHAT_CONTEXT_CHARS = int(os.getenv("CHAT_CONTEXT_CHARS", "12000"))
+
+SEED_REPLY = "Understood. Ask me anything about these results."
+
+
+class AnalysisChat:
+    '''
+    A Gemini chat about the latest analysis result. The result is sent once
+    as the opening turn; each follow-up adds only the question, and the
+    history is cut to the context plus the last max_turns exchanges.
+    '''
+
+    def __init__(self, model_name="gemini-pro", max_turns=CHAT_MAX_TURNS):
+        self.model_name = model_name
+        self.max_turns = max_turns
+        self.context_id = None
+        self.transcript = []
+        self._chat = None
+        self._seed_turns = 0
+
+    def set_context(self, text):
+        '''
+        Start a new conversation about text, unless it is the current context.
+        '''
+        text = (text or "").strip()[:CHAT_CONTEXT_CHARS]
+        context_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if context_id == self.context_id:
+            return
+        history = []
+        if text:
+            history = [
+                {"role": "user", "parts": [f"Here are the results of an image analysis:\n\n{text}"]},
+                {"role": "model", "parts": [SEED_REPLY]},
+            ]
+        self._chat = get_generative_model(self.model_name).start_chat(history=history)
+        self._seed_turns = len(history)
+        self.context_id = context_id
+        self.transcript = []
+
+    def send(self, message, stream=True):
+        '''
+        Send one question; returns the (streamed) response. The transcript is
+        updated once the answer is complete.
+        '''
+        if self._chat is None:
+            self.set_context("")
+        self._trim()
+        response = send_message(self._chat, message, stream=stream)
+        self.transcript.append({"sender": "user", "text": message})
+        if not stream:
+            self.transcript.append({"sender": "ai", "text": response.text})
+            return response
+        return self._collect(response)
+
+    def _collect(self, response):
+        parts = []
+        for chunk in response:
+            parts.append(chunk.text)
+            yield chunk.text
+        self.transcript.append({"sender": "ai", "text": "".join(parts)})
+
+    def _trim(self):
+        history = self._chat.history
+        keep = 2 * self.max_turns
+        if len(history) > self._seed_turns + keep:
+            self._chat.history = history[:self._seed_turns] + history[len(history) - keep:]
+        self.transcript = self.transcript[-keep:]
+
+
+def get_analysis_chat(key="analysis_chat", model_name="gemini-pro"):
+    '''
+    The AnalysisChat of this Streamlit session, kept across reruns.
+    '''
+    if key not in st.session_state:
+        st.session_state[key] = AnalysisChat(model_name)
+    return st.session_state[key]
@@ -0,0 +1,153 @@
+import os
+import random
+import sqlite3
+import threading
+
+# Where the synthetic Chinook database is built (DB_BACKEND=chinook)
+CHINOOK_PATH = os.getenv("CHINOOK_PATH", os.path.join(".cache", "chinook.sqlite"))
+# Row counts are multiplied by this (1 is about the size of the real Chinook)
+CHINOOK_SCALE = float(os.getenv("CHINOOK_SCALE", "1"))
+
+SCHEMA = """
+CREATE TABLE Artist (ArtistId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE Album (
+    AlbumId INTEGER PRIMARY KEY, Title TEXT NOT NULL,
+    ArtistId INTEGER NOT NULL REFERENCES Artist(ArtistId)
+);
+CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE MediaType (MediaTypeId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE Track (
+    TrackId INTEGER PRIMARY KEY, Name TEXT NOT NULL,
+    AlbumId INTEGER REFERENCES Album(AlbumId),
+    MediaTypeId INTEGER NOT NULL REFERENCES MediaType(MediaTypeId),
+    GenreId INTEGER REFERENCES Genre(GenreId),
+    Composer TEXT, Milliseconds INTEGER NOT NULL, Bytes INTEGER, UnitPrice NUMERIC(10, 2) NOT NULL
+);
+CREATE TABLE Employee (
+    EmployeeId INTEGER PRIMARY KEY, LastName TEXT NOT NULL, FirstName TEXT NOT NULL, Title TEXT,
+    ReportsTo INTEGER REFERENCES Employee(EmployeeId), HireDate TEXT, City TEXT, Country TEXT, Email TEXT
+);
+CREATE TABLE Customer (
+    CustomerId INTEGER PRIMARY KEY, FirstName TEXT NOT NULL, LastName TEXT NOT NULL, Company TEXT,
+    City TEXT, Country TEXT, Email TEXT NOT NULL,
+    SupportRepId INTEGER REFERENCES Employee(EmployeeId)
+);
+CREATE TABLE Invoice (
+    InvoiceId INTEGER PRIMARY KEY, CustomerId INTEGER NOT NULL REFERENCES Customer(CustomerId),
+    InvoiceDate TEXT NOT NULL, BillingCity TEXT, BillingCountry TEXT, Total NUMERIC(10, 2) NOT NULL
+);
+CREATE TABLE InvoiceLine (
+    InvoiceLineId INTEGER PRIMARY KEY, InvoiceId INTEGER NOT NULL REFERENCES Invoice(InvoiceId),
+    TrackId INTEGER NOT NULL REFERENCES Track(TrackId), UnitPrice NUMERIC(10, 2) NOT NULL, Quantity INTEGER NOT NULL
+);
+CREATE TABLE Playlist (PlaylistId INTEGER PRIMARY KEY, Name TEXT);
+CREATE TABLE PlaylistTrack (
+    PlaylistId INTEGER NOT NULL REFERENCES Playlist(PlaylistId),
+    TrackId INTEGER NOT NULL REFERENCES Track(TrackId),
+    PRIMARY KEY (PlaylistId, TrackId)
+);
+"""
+
+# Rows per table at scale 1, close to the real Chinook sample database
+ROWS = {"Artist": 275, "Album": 347, "Track": 3503, "Customer": 59, "Invoice": 412, "InvoiceLine": 2240, "Playlist": 18}
+GENRES = ["Rock", "Jazz", "Metal", "Alternative & Punk", "Blues", "Latin", "Reggae", "Pop", "Soundtrack", "Classical"]
+MEDIA_TYPES = ["MPEG audio file", "Protected AAC audio file", "Protected MPEG-4 video file", "Purchased AAC audio file", "AAC audio file"]
+COUNTRIES = ["USA", "Canada", "Brazil", "France", "Germany", "United Kingdom", "Portugal", "India", "Czech Republic", "Chile"]
+CITIES = ["Toronto", "Paris", "Berlin", "London", "Lisbon", "Prague", "Delhi", "Santiago", "Boston", "Sao Paulo"]
+FIRST_NAMES = ["Luis", "Leonie", "Francois", "Bjorn", "Frantisek", "Helena", "Astrid", "Daan", "Kara", "Eduardo", "Alexandre", "Roberto"]
+LAST_NAMES = ["Goncalves", "Kohler", "Tremblay", "Hansen", "Wichterlova", "Holy", "Gruber", "Peeters", "Nielsen", "Martins", "Rocha", "Almeida"]
+WORDS = ["Love", "Night", "Road", "Fire", "Blue", "Heart", "Dream", "Rain", "City", "Light", "Song", "Time", "Black", "Gold", "Wild"]
+
+_build_lock = threading.Lock()
+
+
+def _title(rng, words=2):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def create_chinook(path=CHINOOK_PATH, scale=CHINOOK_SCALE, seed=0):
+    '''
+    Build a synthetic SQLite database with the Chinook schema at path. The
+    data is random but reproducible for a given scale and seed.
+    '''
+    rng = random.Random(seed)
+    count = {table: max(1, int(rows * scale)) for table, rows in ROWS.items()}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = f"{path}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    connection = sqlite3.connect(partial)
+    try:
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT INTO Genre VALUES (?, ?)", enumerate(GENRES, 1))
+        connection.executemany("INSERT INTO MediaType VALUES (?, ?)", enumerate(MEDIA_TYPES, 1))
+        connection.executemany(
+            "INSERT INTO Artist VALUES (?, ?)",
+            ((i, f"{_title(rng)} {i}") for i in range(1, count["Artist"] + 1)),
+        )
+        connection.executemany(
+            "INSERT INTO Album VALUES (?, ?, ?)",
+            ((i, _title(rng, 3), rng.randint(1, count["Artist"])) for i in range(1, count["Album"] + 1)),
+        )
+        tracks = [
+            (
+                i, _title(rng, rng.randint(1, 4)), rng.randint(1, count["Album"]), rng.randint(1, len(MEDIA_TYPES)),
+                rng.randint(1, len(GENRES)), rng.choice([None, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"]),
+                rng.randint(60_000, 600_000), rng.randint(1_000_000, 12_000_000), rng.choice([0.99, 1.99]),
+            )
+            for i in range(1, count["Track"] + 1)
+        ]
+        connection.executemany("INSERT INTO Track VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", tracks)
+        employees = [(1, "Adams", "Andrew", "General Manager", None, "2002-08-14", "Edmonton", "Canada", "andrew@chinookcorp.com")]
+        for i in range(2, 9):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            title = "Sales Support Agent" if i > 2 else "Sales Manager"
+            employees.append((i, last, first, title, 2 if i > 2 else 1, f"{rng.randint(2002, 2004)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+                              rng.choice(CITIES), "Canada", f"{first.lower()}@chinookcorp.com"))
+        connection.executemany("INSERT INTO Employee VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", employees)
+        customers = []
+        for i in range(1, count["Customer"] + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            customers.append((i, first, last, rng.choice([None, f"{rng.choice(WORDS)} Ltd"]), rng.choice(CITIES),
+                              rng.choice(COUNTRIES), f"{first.lower()}.{last.lower()}{i}@example.com", rng.randint(3, 8)))
+        connection.executemany("INSERT INTO Customer VALUES (?, ?, ?, ?, ?, ?, ?, ?)", customers)
+
+        lines, totals = [], {}
+        for i in range(1, count["InvoiceLine"] + 1):
+            invoice = rng.randint(1, count["Invoice"])
+            track = tracks[rng.randrange(len(tracks))]
+            lines.append((i, invoice, track[0], track[8], 1))
+            totals[invoice] = totals.get(invoice, 0) + track[8]
+        invoices = []
+        for i in range(1, count["Invoice"] + 1):
+            customer = customers[rng.randrange(len(customers))]
+            date = f"{rng.randint(2009, 2013)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 00:00:00"
+            invoices.append((i, customer[0], date, customer[4], customer[5], round(totals.get(i, 0.99), 2)))
+        connection.executemany("INSERT INTO Invoice VALUES (?, ?, ?, ?, ?, ?)", invoices)
+        connection.executemany("INSERT INTO InvoiceLine VALUES (?, ?, ?, ?, ?)", lines)
+
+        connection.executemany(
+            "INSERT INTO Playlist VALUES (?, ?)",
+            ((i, _title(rng)) for i in range(1, count["Playlist"] + 1)),
+        )
+        playlist_tracks = {
+            (rng.randint(1, count["Playlist"]), rng.randint(1, count["Track"]))
+            for _ in range(int(count["Track"] * 2.5))
+        }
+        connection.executemany("INSERT INTO PlaylistTrack VALUES (?, ?)", sorted(playlist_tracks))
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(partial, path)
+    return path
+
+
+def chinook_uri(path=CHINOOK_PATH):
+    '''
+    SQLAlchemy URI of the synthetic Chinook database, built on first use.
+    '''
+    with _build_lock:
+        if not os.path.exists(path):
+            create_chinook(path)
+    return f"sqlite:///{path}"
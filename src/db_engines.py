@@ -0,0 +1,59 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+# Connection pool settings shared by every session using the same DSN
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Recycle connections before MySQL's wait_timeout (default 8h) can drop them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_PRE_PING = os.getenv("DB_PRE_PING", "1").lower() in ("1", "true", "yes")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+# Per-statement limit for SELECTs (MySQL MAX_EXECUTION_TIME), 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+def create_pooled_engine(db_uri, statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS):
+    '''
+    Engine with a bounded QueuePool, pre-ping, recycling and, on MySQL, a
+    session-level SELECT timeout applied to every new connection.
+    '''
+    is_mysql = db_uri.startswith("mysql")
+    kwargs = {}
+    if is_mysql:
+        kwargs = {
+            "poolclass": QueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "connect_args": {"connection_timeout": DB_CONNECT_TIMEOUT},
+        }
+    engine = create_engine(db_uri, pool_pre_ping=DB_PRE_PING, **kwargs)
+
+    if is_mysql and statement_timeout_ms:
+        @event.listens_for(engine, "connect")
+        def set_statement_timeout(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(statement_timeout_ms)}")
+            cursor.close()
+
+    return engine
+
+
+def pool_metrics(engine):
+    '''
+    Utilization of the engine's connection pool (QueuePool only).
+    '''
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"status": pool.status()}
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "capacity": pool.size() + pool._max_overflow,
+    }
@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Max differing bits (out of 64) for two slides to count as near-duplicates
+HAMMING_THRESHOLD = int(os.getenv("DEDUP_HAMMING_THRESHOLD", "4"))
+
+
+def _gray(image, size):
+    return np.asarray(image.convert("L").resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+
+
+def _bits_to_int(bits):
+    return int("".join("1" if bit else "0" for bit in bits.flatten()), 2)
+
+
+def dhash(image, hash_size=8):
+    '''
+    Difference hash: sign of the horizontal gradient on a tiny grayscale copy.
+    '''
+    pixels = _gray(image, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image, hash_size=8, highfreq_factor=4):
+    '''
+    Perceptual hash: low-frequency DCT coefficients compared to their median.
+    '''
+    size = hash_size * highfreq_factor
+    dct = cv2.dct(_gray(image, (size, size)))
+    low = dct[:hash_size, :hash_size]
+    return _bits_to_int(low > np.median(low))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def group_duplicates(images, threshold=None):
+    '''
+    Group exact and near-identical images.
+
+    Returns a list of groups (lists of indices in upload order); the first
+    index of each group is its representative. An image joins the first
+    earlier representative whose pHash and dHash are both within threshold
+    bits, so groups never chain through a series of small differences.
+    '''
+    threshold = HAMMING_THRESHOLD if threshold is None else threshold
+    groups = []
+    representatives = []  # (digest, phash, dhash) per group
+    for idx, image in enumerate(images):
+        digest = hashlib.sha256(image.tobytes()).digest()
+        p, d = phash(image), dhash(image)
+        for group, (rep_digest, rep_p, rep_d) in zip(groups, representatives):
+            if digest == rep_digest or (hamming(p, rep_p) <= threshold and hamming(d, rep_d) <= threshold):
+                group.append(idx)
+                break
+        else:
+            groups.append([idx])
+            representatives.append((digest, p, d))
+    return groups
+
+
+def fan_out(results, groups, count):
+    '''
+    Map one result per group back onto every member, in upload order.
+    '''
+    expanded = [None] * count
+    for result, group in zip(results, groups):
+        for idx in group:
+            expanded[idx] = result
+    return expanded
+
+
+def describe_duplicates(groups, label="Slide"):
+    '''
+    Human-readable list of which uploads reused another upload's result.
+    '''
+    lines = []
+    for group in groups:
+        if len(group) > 1:
+            members = ", ".join(str(idx + 1) for idx in group[1:])
+            lines.append(f"{label}(s) {members} reused the result of {label.lower()} {group[0] + 1}.")
+    return "\n".join(lines)
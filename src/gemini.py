@@ -0,0 +1,123 @@
+import time
+
+from src.rate_limit import call_with_retry, get_rate_limiter
+from src.response_cache import get_response_cache, make_key
+from src.tokens import IMAGE_TOKENS, estimate_tokens
+from src.tracing import get_tracer
+
+
+class CachedResponse:
+    '''
+    Stand-in for a GenerateContentResponse served from the response cache.
+    '''
+
+    def __init__(self, text):
+        self.text = text
+        self.from_cache = True
+
+
+def measure_contents(contents):
+    '''
+    (estimated prompt tokens, image bytes) of a generate_content request.
+    '''
+    tokens, image_bytes = 0, 0
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    for part in parts:
+        if isinstance(part, str):
+            tokens += estimate_tokens(part)
+        elif isinstance(part, dict) and "parts" in part:
+            part_tokens, part_bytes = measure_contents(part["parts"])
+            tokens += part_tokens
+            image_bytes += part_bytes
+        elif isinstance(part, dict) and "data" in part:
+            tokens += IMAGE_TOKENS
+            image_bytes += len(part["data"])
+        elif isinstance(part, (bytes, bytearray)):
+            tokens += IMAGE_TOKENS
+            image_bytes += len(part)
+        elif hasattr(part, "size") and hasattr(part, "mode"):
+            # PIL image, uploaded as PNG by the client; count raw pixels
+            tokens += IMAGE_TOKENS
+            image_bytes += part.size[0] * part.size[1] * len(part.getbands())
+    return tokens, image_bytes
+
+
+def _call_model(model, request, call):
+    # Shared per-model quota; only this call is retried when it is rate limited.
+    # Stub and replay models have no provider quota unless RATE_LIMITS sets one.
+    provider = "gemini" if getattr(model, "backend", "live") in ("live", "record") else "local"
+    limiter = get_rate_limiter(provider, model.model_name)
+
+    def on_retry(attempt, error):
+        call["retries"] = attempt
+
+    return call_with_retry(request, limiter, call["prompt_tokens"], on_retry=on_retry)
+
+
+def generate_content(model, contents, bypass_cache=False, **kwargs):
+    '''
+    Call model.generate_content through the shared response cache.
+
+    The key covers the prompt text, image bytes, model name, generation
+    config and the fingerprint of a fixed prompt attached to the model.
+    Streaming calls and bypass_cache=True always go to the model. Model
+    calls wait for the model's rate limiter and are retried with backoff
+    when rate limited. Every call is recorded by the tracer.
+    '''
+    cache = get_response_cache()
+    tracer = get_tracer()
+    prompt_tokens, image_bytes = measure_contents(contents)
+    # A fixed prompt attached to the model (src.prompts) is billed on every call too
+    prompt_tokens += getattr(model, "prompt_tokens", 0)
+    call = {"prompt_tokens": prompt_tokens, "image_bytes": image_bytes, "retries": 0}
+
+    if bypass_cache or not cache.enabled or kwargs.get("stream"):
+        cache.record_bypass()
+        if kwargs.get("stream"):
+            started = time.perf_counter()
+            response = _call_model(model, lambda: model.generate_content(contents, **kwargs), call)
+            return tracer.stream(response, "gemini", model.model_name, started, **call)
+        with tracer.span("gemini", model.model_name, **call) as span:
+            return _call_model(model, lambda: model.generate_content(contents, **kwargs), span)
+
+    generation_config = kwargs.get("generation_config") or getattr(model, "_generation_config", None)
+    fingerprint = getattr(model, "prompt_fingerprint", None)
+    key = make_key([fingerprint, contents] if fingerprint else contents, model.model_name, generation_config)
+    with tracer.span("gemini", model.model_name, **call) as span:
+        text = cache.get(key)
+        if text is not None:
+            span["cache_hit"] = True
+            return CachedResponse(text)
+
+        response = _call_model(model, lambda: model.generate_content(contents, **kwargs), span)
+    try:
+        text = response.text
+    except ValueError:
+        # Blocked or empty candidates: let the caller see the real response
+        return response
+    cache.put(key, text)
+    return response
+
+
+def send_message(chat, content, **kwargs):
+    '''
+    chat.send_message with the same rate limiting, retries and tracing as
+    generate_content. Chat turns depend on the history and are never cached.
+    '''
+    tracer = get_tracer()
+    model = chat.model
+    history_tokens, _ = measure_contents([{"parts": _parts(turn)} for turn in chat.history])
+    prompt_tokens, image_bytes = measure_contents(content)
+    call = {"prompt_tokens": history_tokens + prompt_tokens, "image_bytes": image_bytes, "retries": 0}
+    if kwargs.get("stream"):
+        started = time.perf_counter()
+        response = _call_model(model, lambda: chat.send_message(content, **kwargs), call)
+        return tracer.stream(response, "gemini", model.model_name, started, **call)
+    with tracer.span("gemini", model.model_name, **call) as span:
+        return _call_model(model, lambda: chat.send_message(content, **kwargs), span)
+
+
+def _parts(turn):
+    # History turns are dicts locally and Content messages from the client
+    parts = turn["parts"] if isinstance(turn, dict) else turn.parts
+    return [part if isinstance(part, str) else getattr(part, "text", "") for part in parts]
@@ -0,0 +1,113 @@
+import os
+
+from src.query_cache import normalize_sql
+from src.tokens import estimate_tokens
+
+# Token budget for the conversation history pasted into each prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Most recent question/answer turns kept word for word
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "3"))
+
+SUMMARY_QUESTION_CHARS = 120
+SUMMARY_ANSWER_CHARS = 100
+SUMMARY_SQL_CHARS = 240
+
+
+def _shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _turns(messages):
+    '''
+    Group messages into turns: a human message and the AI reply after it.
+    The AI reply may carry the SQL it ran in additional_kwargs["sql"].
+    '''
+    turns = []
+    for message in messages:
+        if message.type == "human":
+            turns.append({"question": message.content, "answer": "", "sql": None})
+        elif message.type == "ai" and turns:
+            turns[-1]["answer"] = message.content
+            turns[-1]["sql"] = getattr(message, "additional_kwargs", {}).get("sql")
+    return turns
+
+
+def _render_turn(turn):
+    lines = [f"User: {turn['question']}"]
+    if turn["sql"]:
+        lines.append(f"SQL: {turn['sql']}")
+    if turn["answer"]:
+        lines.append(f"Assistant: {turn['answer']}")
+    return "\n".join(lines)
+
+
+def _fold_turn(turn):
+    line = f"- Q: {_shorten(turn['question'], SUMMARY_QUESTION_CHARS)}"
+    if turn["sql"]:
+        line += f" | SQL: {_shorten(normalize_sql(turn['sql']), SUMMARY_SQL_CHARS)}"
+    if turn["answer"]:
+        line += f" | A: {_shorten(turn['answer'], SUMMARY_ANSWER_CHARS)}"
+    return line
+
+
+class HistoryCompactor:
+    '''
+    Keeps the prompt history within a token budget.
+
+    The last recent_turns turns are rendered verbatim. Older turns are folded,
+    once each, into one-line summaries that keep the question, the SQL that
+    ran and the start of the answer. When even that does not fit, the oldest
+    summary lines are left out. Recent turns that alone exceed the budget are
+    folded as well, oldest first, and a single oversized turn is cut short.
+    '''
+
+    def __init__(self, budget=HISTORY_TOKEN_BUDGET, recent_turns=HISTORY_RECENT_TURNS):
+        self.budget = budget
+        self.recent_turns = recent_turns
+        self.summary_lines = []
+
+    def render(self, messages, question=None):
+        turns = _turns(messages)
+        # The current question is passed to the prompt separately
+        if question is not None and turns and turns[-1]["question"] == question and not turns[-1]["answer"]:
+            turns = turns[:-1]
+
+        older = turns[:-self.recent_turns] if self.recent_turns else turns
+        recent = turns[len(older):]
+        # Incremental: only turns that newly left the verbatim window are folded
+        for turn in older[len(self.summary_lines):]:
+            self.summary_lines.append(_fold_turn(turn))
+
+        # Long answers (result tables) can fill the budget on their own: fold the
+        # oldest recent turns too, and cut the last one if it still does not fit
+        folded = []
+        while len(recent) > 1 and estimate_tokens("\n".join(map(_render_turn, recent))) > self.budget:
+            folded.append(_fold_turn(recent[0]))
+            recent = recent[1:]
+        recent_text = "\n".join(_render_turn(turn) for turn in recent)
+        if estimate_tokens(recent_text) > self.budget:
+            # estimate_tokens counts len // 4 + 1, so this stays within the budget
+            recent_text = recent_text[:max(0, (self.budget - 1) * 4 - 3)] + "..." if self.budget > 1 else ""
+        summary_lines = self.summary_lines + folded
+
+        remaining = self.budget - estimate_tokens(recent_text)
+        kept = []
+        for line in reversed(summary_lines):
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            kept.append(line)
+            remaining -= cost
+        kept.reverse()
+
+        parts = []
+        if kept or summary_lines:
+            header = "Earlier turns (summarized):"
+            omitted = len(summary_lines) - len(kept)
+            if omitted:
+                header += f" {omitted} older turn(s) omitted."
+            parts.append("\n".join([header] + kept))
+        if recent_text:
+            parts.append(recent_text)
+        return "\n\n".join(parts)
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from src.preprocess import flatten_alpha
+
+
+class DecodedImage:
+    '''
+    An uploaded image decoded exactly once into an RGB NumPy buffer.
+
+    The grayscale view and the PIL image handed to the model are derived
+    lazily from that buffer and cached, so the scoring functions and the
+    model call share one decode and nothing is written to disk.
+    '''
+
+    def __init__(self, rgb):
+        self.rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
+        self._gray = None
+        self._pil = None
+
+    @classmethod
+    def from_pil(cls, image):
+        # Transparent areas become white, as in prepare_image, not black
+        image = flatten_alpha(ImageOps.exif_transpose(image))
+        return cls(np.asarray(image))
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def size(self):
+        height, width = self.rgb.shape[:2]
+        return width, height
+
+    def to_pil(self):
+        # Image.fromarray wraps the existing buffer instead of copying it
+        if self._pil is None:
+            self._pil = Image.fromarray(self.rgb)
+        return self._pil
@@ -0,0 +1,114 @@
+import os
+import re
+
+from src.gemini import generate_content
+from src.parallel import run_in_parallel
+from src.tokens import IMAGE_TOKENS, estimate_tokens
+
+# Per-request budget for packed calls (gemini-pro-vision: 16 images, ~12k input tokens, 20 MB inline data)
+PACK_MAX_IMAGES = int(os.getenv("PACK_MAX_IMAGES", "16"))
+PACK_MAX_TOKENS = int(os.getenv("PACK_MAX_TOKENS", "10000"))
+PACK_MAX_MB = float(os.getenv("PACK_MAX_MB", "4"))
+
+PACK_INSTRUCTIONS = (
+    "You are given {count} slides, each preceded by its label. Consider them together as one deck. "
+    "First write your answer for the slides as a group. Then write one section per slide, each starting "
+    "on its own line with the heading '### Slide <number>' using the slide labels given below."
+)
+
+# The '### Slide <n>' headings PACK_INSTRUCTIONS asks for; prose lines starting "Slide 3 ..." are not headings
+SECTION_HEADING = re.compile(r"^[ \t]*#{1,6}[ \t]*[*_]*Slide[ \t]+(\d+)\b[ \t*_:.)-]*", re.IGNORECASE | re.MULTILINE)
+
+
+def pack(sizes, prompt, max_images=None, max_tokens=None, max_bytes=None, fixed_tokens=0):
+    '''
+    Split images (given by their encoded byte sizes) into consecutive packs
+    that each fit the image, token and byte budget of one request.
+    fixed_tokens counts a prompt attached to the model rather than the contents.
+    Returns a list of index lists.
+    '''
+    max_images = max_images or PACK_MAX_IMAGES
+    max_tokens = max_tokens or PACK_MAX_TOKENS
+    max_bytes = max_bytes or int(PACK_MAX_MB * 1024 * 1024)
+    base_tokens = fixed_tokens + estimate_tokens(prompt) + estimate_tokens(PACK_INSTRUCTIONS)
+    per_image_tokens = IMAGE_TOKENS + estimate_tokens("Slide 000:")
+
+    packs, current, tokens, size = [], [], base_tokens, 0
+    for idx, image_bytes in enumerate(sizes):
+        fits = (
+            len(current) < max_images
+            and tokens + per_image_tokens <= max_tokens
+            and size + image_bytes <= max_bytes
+        )
+        if current and not fits:
+            packs.append(current)
+            current, tokens, size = [], base_tokens, 0
+        current.append(idx)
+        tokens += per_image_tokens
+        size += image_bytes
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_contents(prompt, blobs, numbers):
+    contents = ["\n\n".join(filter(None, [prompt, PACK_INSTRUCTIONS.format(count=len(blobs))]))]
+    for number, blob in zip(numbers, blobs):
+        contents.append(f"Slide {number}:")
+        contents.append(blob)
+    return contents
+
+
+def split_sections(text, numbers):
+    '''
+    Split a packed response into (overview, {slide number: section text}).
+    Headings for numbers outside this pack are left in the surrounding text.
+    '''
+    wanted = set(numbers)
+    matches = [m for m in SECTION_HEADING.finditer(text) if int(m.group(1)) in wanted]
+    if not matches:
+        return text.strip(), {}
+
+    overview = text[:matches[0].start()].strip()
+    sections = {}
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        number = int(match.group(1))
+        body = text[match.end():end].strip()
+        sections[number] = f"{sections[number]}\n\n{body}" if number in sections else body
+    return overview, sections
+
+
+def generate_packed(model, prompt, prepared_images, numbers=None):
+    '''
+    Analyze prepared images in as few generate_content calls as the budget
+    allows. numbers are the slide labels (default 1..N). prompt may be empty
+    when the model carries it (src.prompts).
+
+    Returns (overviews, sections): one cross-slide overview per pack, and one
+    section per image in input order (None when the model skipped a slide).
+    '''
+    numbers = list(numbers or range(1, len(prepared_images) + 1))
+    packs = pack([p.encoded_bytes for p in prepared_images], prompt,
+                 fixed_tokens=getattr(model, "prompt_tokens", 0))
+
+    def run_pack(indices):
+        pack_numbers = [numbers[i] for i in indices]
+        contents = build_contents(prompt, [prepared_images[i].blob for i in indices], pack_numbers)
+        response = generate_content(model, contents)
+        return split_sections(response.text, pack_numbers)
+
+    # A failed pack only loses its own slides
+    results = run_in_parallel(run_pack, packs, return_exceptions=True)
+    overviews = []
+    sections = [None] * len(prepared_images)
+    for indices, result in zip(packs, results):
+        if isinstance(result, Exception):
+            labels = ", ".join(str(numbers[i]) for i in indices)
+            overviews.append(f"An error occurred for slides {labels}: {result}")
+            continue
+        overview, pack_sections = result
+        overviews.append(overview)
+        for i in indices:
+            sections[i] = pack_sections.get(numbers[i])
+    return overviews, sections
@@ -0,0 +1,43 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Maximum number of model calls in flight at once (override with GEMINI_MAX_CONCURRENCY)
+DEFAULT_MAX_WORKERS = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+def run_in_parallel(func, items, max_workers=None, on_progress=None, return_exceptions=False):
+    '''
+    Run func over every item on a bounded thread pool.
+
+    Results are returned in the same order as items. on_progress(done, total)
+    is called from the calling thread as each item finishes, so it is safe to
+    update Streamlit widgets from it (worker threads must not touch st.*).
+    Workers run in a copy of the caller's context, so context variables such
+    as the traced session carry over.
+
+    By default the first exception cancels the remaining items and is
+    raised. With return_exceptions=True a failed item's exception takes its
+    place in the results and the other items still run.
+    '''
+    items = list(items)
+    total = len(items)
+    if total == 0:
+        return []
+
+    workers = max(1, min(max_workers or DEFAULT_MAX_WORKERS, total))
+    results = [None] * total
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(contextvars.copy_context().run, func, item): idx for idx, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            if return_exceptions and future.exception() is not None:
+                results[futures[future]] = future.exception()
+            else:
+                results[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, total)
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    return results
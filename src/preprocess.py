@@ -0,0 +1,129 @@
+import io
+import os
+
+from PIL import Image, ImageOps
+
+from src.parallel import run_in_parallel
+
+# Longest edge sent to the model; Gemini downsamples anything larger anyway
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+# Upload format: JPEG or WEBP
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+# Byte budget per image; quality (then size) is stepped down until it fits
+IMAGE_MAX_KB = int(os.getenv("IMAGE_MAX_KB", "512"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+
+MIN_QUALITY = 50
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class PreparedImage:
+    '''
+    An image re-encoded for upload, plus the numbers needed to report savings.
+    blob can be passed to generate_content in place of a PIL image.
+    '''
+
+    def __init__(self, data, image_format, size, original_bytes=None):
+        self.blob = {"mime_type": MIME_TYPES[image_format], "data": data}
+        self.size = size
+        self.original_bytes = original_bytes
+        self.encoded_bytes = len(data)
+
+    @property
+    def bytes_saved(self):
+        if self.original_bytes is None:
+            return None
+        return self.original_bytes - self.encoded_bytes
+
+
+def open_upload(uploaded_file):
+    '''
+    Image.open for st.file_uploader files that remembers the upload size,
+    so prepare_image can report how many bytes it saved.
+    '''
+    image = Image.open(uploaded_file)
+    size = getattr(uploaded_file, "size", None)
+    if size is None and hasattr(uploaded_file, "getvalue"):
+        size = len(uploaded_file.getvalue())
+    image.info["upload_bytes"] = size
+    return image
+
+
+def normalize_orientation(image):
+    '''
+    Apply the EXIF orientation tag so phone photos are not sent sideways.
+    '''
+    return ImageOps.exif_transpose(image)
+
+
+def flatten_alpha(image, background=(255, 255, 255)):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        flattened = Image.new("RGB", image.size, background)
+        flattened.paste(image, mask=image.getchannel("A"))
+        return flattened
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=image_format == "JPEG")
+    return buffer.getvalue()
+
+
+def prepare_image(image, max_edge=None, image_format=None, max_kb=None, quality=None, original_bytes=None):
+    '''
+    Normalize orientation, flatten alpha, downscale to max_edge and re-encode
+    as JPEG/WEBP within the max_kb budget.
+    '''
+    max_edge = max_edge or IMAGE_MAX_EDGE
+    image_format = (image_format or IMAGE_FORMAT).upper()
+    max_bytes = (max_kb or IMAGE_MAX_KB) * 1024
+    quality = quality or IMAGE_QUALITY
+    if original_bytes is None:
+        original_bytes = image.info.get("upload_bytes")
+
+    image = flatten_alpha(normalize_orientation(image))
+    if max(image.size) > max_edge:
+        image = image.copy()
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    while True:
+        for step in range(quality, MIN_QUALITY - 1, -10):
+            data = _encode(image, image_format, step)
+            if len(data) <= max_bytes:
+                return PreparedImage(data, image_format, image.size, original_bytes)
+        if max(image.size) <= 256:
+            # Budget is unreachable; send the smallest encoding we have
+            return PreparedImage(data, image_format, image.size, original_bytes)
+        image = image.resize((max(1, image.width * 3 // 4), max(1, image.height * 3 // 4)), Image.Resampling.LANCZOS)
+
+
+def prepare_images(images, **kwargs):
+    # PIL releases the GIL while resizing and encoding, so threads help here
+    return run_in_parallel(lambda image: prepare_image(image, **kwargs), images)
+
+
+def _format_bytes(count):
+    if count >= 1024 * 1024:
+        return f"{count / (1024 * 1024):.1f} MB"
+    return f"{count / 1024:.0f} KB"
+
+
+def describe_savings(prepared_images):
+    '''
+    One-line summary of upload bytes before and after pre-processing.
+    '''
+    prepared_images = list(prepared_images)
+    encoded = sum(p.encoded_bytes for p in prepared_images)
+    known = [p for p in prepared_images if p.original_bytes is not None]
+    if not known:
+        return f"Uploaded {len(prepared_images)} image(s), {_format_bytes(encoded)} after pre-processing."
+    original = sum(p.original_bytes for p in known)
+    saved = sum(p.bytes_saved for p in known)
+    return (
+        f"Uploaded {len(prepared_images)} image(s): {_format_bytes(original)} -> {_format_bytes(encoded)} "
+        f"(saved {_format_bytes(max(saved, 0))})."
+    )
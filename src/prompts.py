@@ -0,0 +1,148 @@
+import hashlib
+import os
+import re
+import threading
+
+from src.backends import get_generative_model
+from src.tokens import estimate_tokens
+
+# auto: system instructions on models that support them; always / never to override
+PROMPT_SYSTEM_INSTRUCTION = os.getenv("PROMPT_SYSTEM_INSTRUCTION", "auto").lower()
+# Model families that accept system_instruction (gemini-pro and gemini-pro-vision do not)
+SYSTEM_INSTRUCTION_MODELS = ("gemini-1.5", "gemini-2", "gemini-exp")
+
+SPACES = re.compile(r"[ \t]+")
+
+
+def compact(text):
+    '''
+    The prompt with runs of spaces collapsed and blank lines dropped; the
+    wording and line structure stay the same.
+    '''
+    lines = (SPACES.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def supports_system_instruction(model_name):
+    if PROMPT_SYSTEM_INSTRUCTION in ("always", "never"):
+        return PROMPT_SYSTEM_INSTRUCTION == "always"
+    return model_name.split("/")[-1].startswith(SYSTEM_INSTRUCTION_MODELS)
+
+
+class Prompt:
+    '''
+    A fixed prompt prefix: its compact text and a fingerprint of that text.
+    '''
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = compact(text)
+        self.fingerprint = hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:12]
+        self.raw_tokens = estimate_tokens(text)
+        self.tokens = estimate_tokens(self.text)
+
+
+class PromptedModel:
+    '''
+    A model with a fixed prompt prefix attached, so callers pass only the
+    variable part of each request. The prefix goes in the system
+    instruction when the model supports one, otherwise in front of the
+    contents. Everything else is delegated to the wrapped model.
+    '''
+
+    def __init__(self, model, prompt, system):
+        self._model = model
+        self._prompt = prompt
+        self.system = system
+        self.calls = 0
+        # Read by gemini.generate_content for cache keys and token counts
+        self.prompt_fingerprint = prompt.fingerprint
+        self.prompt_tokens = prompt.tokens
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        if self.system:
+            return self._model.generate_content(contents, **kwargs)
+        parts = contents if isinstance(contents, list) else [contents]
+        return self._model.generate_content([self._prompt.text, *parts], **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class PromptRegistry:
+    '''
+    Named fixed prompts, shared by every session. Registering the same
+    name again (Streamlit reruns the script) keeps the entry unless the text
+    changed.
+    '''
+
+    def __init__(self):
+        self._prompts = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, text):
+        prompt = Prompt(name, text)
+        with self._lock:
+            current = self._prompts.get(name)
+            if current is not None and current.fingerprint == prompt.fingerprint:
+                return current
+            self._prompts[name] = prompt
+            return prompt
+
+    def get(self, name):
+        with self._lock:
+            return self._prompts[name]
+
+    def model(self, model_name, name):
+        prompt = self.get(name)
+        key = (model_name, prompt.fingerprint)
+        with self._lock:
+            model = self._models.get(key)
+        if model is None:
+            system = supports_system_instruction(model_name)
+            inner = get_generative_model(model_name, system_instruction=prompt.text) if system \
+                else get_generative_model(model_name)
+            model = PromptedModel(inner, prompt, system)
+            with self._lock:
+                self._models[key] = model
+        return model
+
+    def stats(self):
+        '''
+        Per model and prompt: calls, prompt tokens per call and the tokens
+        compaction saved.
+        '''
+        with self._lock:
+            models = list(self._models.items())
+        return [{
+            "model": model_name,
+            "prompt": model._prompt.name,
+            "fingerprint": model.prompt_fingerprint,
+            "sent_as": "system instruction" if model.system else "prefix",
+            "calls": model.calls,
+            "tokens": model.prompt_tokens,
+            "tokens_saved": (model._prompt.raw_tokens - model.prompt_tokens) * model.calls,
+        } for (model_name, _), model in models if model.calls]
+
+
+_registry = PromptRegistry()
+
+
+def register_prompt(name, text):
+    return _registry.register(name, text)
+
+
+def prompted_model(model_name, name=None):
+    '''
+    The model with the registered prompt name attached, or the plain model
+    when name is None.
+    '''
+    if name is None:
+        return get_generative_model(model_name)
+    return _registry.model(model_name, name)
+
+
+def prompt_stats():
+    return _registry.stats()
@@ -0,0 +1,223 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+# Bounds of the per-database result cache
+QUERY_CACHE_ITEMS = int(os.getenv("QUERY_CACHE_ITEMS", "512"))
+QUERY_CACHE_MAX_MB = float(os.getenv("QUERY_CACHE_MAX_MB", "64"))
+# Every result expires after this many seconds, even when its table versions did not change
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+
+TOKEN = re.compile(
+    r"""
+    (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<quoted>`[^`]*`)
+    |(?P<number>\d+\.\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?|\d+(?:[eE][-+]?\d+)?)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<symbol><=|>=|<>|!=|\|\||[^\sA-Za-z0-9_])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+KEYWORDS = {
+    "select", "from", "where", "and", "or", "not", "in", "is", "null", "like", "between", "as", "on",
+    "join", "inner", "left", "right", "outer", "cross", "full", "natural", "using", "group", "by",
+    "order", "asc", "desc", "limit", "offset", "having", "distinct", "union", "all", "case", "when",
+    "then", "else", "end", "exists", "count", "sum", "avg", "min", "max", "with", "true", "false",
+}
+
+TABLE_PREFIXES = {"FROM", "JOIN"}
+
+# Results depend on when or where the query runs, not only on the tables
+NONDETERMINISTIC_FUNCTIONS = {
+    "NOW", "CURDATE", "CURTIME", "SYSDATE", "UNIX_TIMESTAMP", "RAND", "RANDOM", "UUID", "UUID_SHORT",
+    "CONNECTION_ID", "LAST_INSERT_ID", "FOUND_ROWS", "ROW_COUNT", "USER", "CURRENT_USER", "SESSION_USER",
+    "SYSTEM_USER",
+}
+# The same, usable without parentheses
+NONDETERMINISTIC_KEYWORDS = {
+    "CURRENT_DATE", "CURRENT_TIME", "CURRENT_TIMESTAMP", "LOCALTIME", "LOCALTIMESTAMP", "UTC_DATE",
+    "UTC_TIME", "UTC_TIMESTAMP",
+}
+
+
+def _canonical_string(token):
+    quote = token[0]
+    body = token[1:-1].replace(quote * 2, quote)
+    return "'" + body.replace("'", "''") + "'"
+
+
+def _canonical_number(token):
+    try:
+        return format(Decimal(token).normalize(), "f")
+    except InvalidOperation:
+        return token
+
+
+def tokenize(sql):
+    '''
+    Canonical SQL tokens: comments dropped, keywords upper-cased, string
+    literals single-quoted, numbers normalized (1.50 -> 1.5) and simple
+    backtick identifiers unquoted. Identifier case is kept because MySQL
+    table names can be case-sensitive.
+    '''
+    tokens = []
+    for match in TOKEN.finditer(sql):
+        kind, value = match.lastgroup, match.group()
+        if kind == "comment":
+            continue
+        if kind == "string":
+            value = _canonical_string(value)
+        elif kind == "number":
+            value = _canonical_number(value)
+        elif kind == "quoted" and re.fullmatch(r"`[A-Za-z0-9_$]+`", value):
+            value = value[1:-1]
+        elif kind == "word" and value.lower() in KEYWORDS:
+            value = value.upper()
+        tokens.append(value)
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    return tokens
+
+
+def normalize_sql(sql):
+    return " ".join(tokenize(sql))
+
+
+KEYWORDS_UPPER = {keyword.upper() for keyword in KEYWORDS}
+
+
+def referenced_tables(sql):
+    '''
+    Table names that follow FROM/JOIN, including comma-separated FROM lists.
+    Derived tables (FROM (SELECT ...)) are skipped; their own FROMs count.
+    '''
+    tokens = tokenize(sql)
+    tables = set()
+    for idx, token in enumerate(tokens):
+        if token not in TABLE_PREFIXES:
+            continue
+        pos = idx + 1
+        while pos < len(tokens) and tokens[pos] != "(" and tokens[pos] not in KEYWORDS_UPPER:
+            # schema.table -> table
+            while pos + 2 < len(tokens) and tokens[pos + 1] == ".":
+                pos += 2
+            tables.add(tokens[pos].strip("`"))
+            pos += 1
+            # Optional alias, then only a comma continues the table list
+            if pos < len(tokens) and tokens[pos] == "AS":
+                pos += 1
+            if pos < len(tokens) and tokens[pos] not in KEYWORDS_UPPER and tokens[pos] not in (",", ")"):
+                pos += 1
+            if token == "FROM" and pos < len(tokens) and tokens[pos] == ",":
+                pos += 1
+                continue
+            break
+    return tables
+
+
+def is_deterministic(sql):
+    '''
+    False when sql calls NOW(), RAND(), UUID() and the like, or uses
+    SQLite's 'now'; such results must not be cached.
+    '''
+    tokens = tokenize(sql)
+    for idx, token in enumerate(tokens):
+        word = token.upper()
+        if word in NONDETERMINISTIC_KEYWORDS or token.lower() == "'now'":
+            return False
+        if word in NONDETERMINISTIC_FUNCTIONS and idx + 1 < len(tokens) and tokens[idx + 1] == "(":
+            return False
+    return True
+
+
+class QueryCache:
+    '''
+    LRU cache of query results keyed by normalized SQL plus the versions of
+    the tables it reads. A change in any referenced table's version makes
+    the old entry unreachable; it then ages out of the LRU. Every entry also
+    expires after ttl seconds, and queries that are not deterministic are
+    never cached.
+    '''
+
+    def __init__(self, max_items=QUERY_CACHE_ITEMS, max_bytes=int(QUERY_CACHE_MAX_MB * 1024 * 1024), ttl=QUERY_CACHE_TTL):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "uncacheable": 0}
+
+    def key(self, sql, versions):
+        tables = sorted(referenced_tables(sql))
+        table_versions = tuple((table, versions.get(table)) for table in tables)
+        return normalize_sql(sql), table_versions
+
+    def _expires(self, key):
+        # Table versions can lag behind writes (MySQL caches UPDATE_TIME), so
+        # even fully versioned entries are only trusted for ttl seconds
+        return time.time() + self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, size, expires = entry
+                if expires is None or time.time() < expires:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return result
+                self._drop(key)
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        size = len(str(result))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, size, self._expires(key))
+            self._bytes += size
+            while len(self._entries) > self.max_items or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def contains(self, sql, versions):
+        # Peek without touching the LRU order or the hit/miss counters
+        key = self.key(sql, versions)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry[2] is None or time.time() < entry[2])
+
+    def run(self, sql, versions, execute):
+        '''
+        execute(sql) through the cache.
+        '''
+        if not is_deterministic(sql):
+            with self._lock:
+                self._counters["uncacheable"] += 1
+            return execute(sql)
+        key = self.key(sql, versions)
+        result = self.get(key)
+        if result is None:
+            result = execute(sql)
+            self.put(key, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import random
+import threading
+import time
+
+# Default quotas per provider; 0 disables a limit
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "5000"))
+# Per-model overrides: "gemini-pro-vision=60/32000;mixtral-8x7b-32768=30/5000"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+# Requests that may start at once above the steady rate
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "1"))
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+
+PROVIDER_LIMITS = {"gemini": (GEMINI_RPM, GEMINI_TPM), "groq": (GROQ_RPM, GROQ_TPM)}
+API_KEY_VARIABLES = {"gemini": "GOOGLE_API_KEY", "groq": "GROQ_API_KEY"}
+# Status codes worth retrying: rate limited, overloaded, unavailable
+RETRYABLE_STATUS = {429, 500, 503}
+RETRYABLE_NAMES = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "RateLimitError", "InternalServerError"}
+
+
+def _parse_overrides(text):
+    overrides = {}
+    for item in filter(None, (part.strip() for part in text.split(";"))):
+        model, _, limits = item.partition("=")
+        rpm, _, tpm = limits.partition("/")
+        overrides[model.strip()] = (float(rpm or 0), float(tpm or 0))
+    return overrides
+
+
+MODEL_LIMITS = _parse_overrides(RATE_LIMITS)
+
+
+class TokenBucket:
+    '''
+    Refills at per_minute / 60 units per second up to capacity. The level may
+    go negative when more is taken than is available (tokens are often only
+    known after a call); later callers then wait for the debt to refill.
+    '''
+
+    def __init__(self, per_minute, capacity):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class RateLimiter:
+    '''
+    Requests-per-minute and tokens-per-minute limit for one model and API
+    key, shared by every thread and session in the process. acquire() blocks
+    until both buckets allow the call; the number of callers blocked there
+    is the queue depth.
+    '''
+
+    def __init__(self, name, rpm, tpm, burst=RATE_LIMIT_BURST):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm, max(1.0, burst)) if rpm > 0 else None
+        # A minute's worth, as the providers count it: bursts within the quota never wait
+        self._tokens = TokenBucket(tpm, tpm) if tpm > 0 else None
+        self._condition = threading.Condition(threading.RLock())
+        self._counters = {"acquired": 0, "waiting": 0, "max_waiting": 0, "waited_seconds": 0.0,
+                          "throttled": 0, "retries": 0, "tokens": 0}
+
+    def acquire(self, tokens=0):
+        started = time.monotonic()
+        with self._condition:
+            self._counters["waiting"] += 1
+            self._counters["max_waiting"] = max(self._counters["max_waiting"], self._counters["waiting"])
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = 0.0
+                    if self._requests is not None:
+                        wait = max(wait, self._requests.wait_time(1, now))
+                    if self._tokens is not None:
+                        # Wait only while in debt, so a request larger than the bucket still runs
+                        wait = max(wait, self._tokens.wait_time(0, now))
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                if self._requests is not None:
+                    self._requests.take(1)
+                self.debit(tokens)
+                self._counters["acquired"] += 1
+            finally:
+                self._counters["waiting"] -= 1
+                self._counters["waited_seconds"] += time.monotonic() - started
+
+    def debit(self, tokens):
+        # Also used after a call once the real token usage is known
+        with self._condition:
+            if tokens and self._tokens is not None:
+                self._tokens.take(tokens)
+            self._counters["tokens"] += tokens or 0
+
+    def throttled(self):
+        '''
+        The provider rejected a call: empty the request bucket so every
+        waiting caller slows down, not just the one that was rejected.
+        '''
+        with self._condition:
+            self._counters["throttled"] += 1
+            if self._requests is not None:
+                self._requests.level = min(self._requests.level, 0.0)
+
+    def retried(self):
+        with self._condition:
+            self._counters["retries"] += 1
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+        stats.update(name=self.name, rpm=self.rpm, tpm=self.tpm)
+        return stats
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider, model):
+    '''
+    Process-wide limiter for (provider, model, API key).
+    '''
+    model = model.split("/")[-1]
+    key = os.getenv(API_KEY_VARIABLES.get(provider, ""), "")
+    key_id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8] if key else "default"
+    with _limiters_lock:
+        limiter = _limiters.get((provider, model, key_id))
+        if limiter is None:
+            rpm, tpm = MODEL_LIMITS.get(model, PROVIDER_LIMITS.get(provider, (0, 0)))
+            limiter = RateLimiter(f"{provider}:{model}", rpm, tpm)
+            _limiters[(provider, model, key_id)] = limiter
+        return limiter
+
+
+def rate_limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def is_retryable(error):
+    '''
+    True for rate limiting (429 / ResourceExhausted) and transient server errors.
+    '''
+    if type(error).__name__ in RETRYABLE_NAMES:
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and status in RETRYABLE_STATUS:
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in RETRYABLE_STATUS
+
+
+def retry_after(error):
+    # Seconds the server asked us to wait, if it said so
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    # Full jitter: concurrent callers that failed together spread out
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def call_with_retry(func, limiter, tokens=0, attempts=RETRY_ATTEMPTS, on_retry=None):
+    '''
+    func() under limiter, retried with jittered exponential backoff (or the
+    server's Retry-After) while it fails with a retryable error.
+    '''
+    attempt = 0
+    while True:
+        limiter.acquire(tokens)
+        try:
+            return func()
+        except Exception as e:
+            if not is_retryable(e) or attempt >= attempts:
+                raise
+            limiter.throttled()
+            delay = retry_after(e) or backoff_delay(attempt)
+            attempt += 1
+            limiter.retried()
+            if on_retry is not None:
+                on_retry(attempt, e)
+            time.sleep(delay)
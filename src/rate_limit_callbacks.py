@@ -0,0 +1,42 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+
+from src.rate_limit import is_retryable
+
+
+class ChatRateLimiter(BaseRateLimiter):
+    '''
+    Lets a LangChain chat model wait on a shared RateLimiter before each call.
+    Token usage is only known afterwards and is debited by
+    RateLimitCallbackHandler.
+    '''
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def acquire(self, *, blocking=True):
+        if not blocking and self.limiter.stats()["waiting"]:
+            return False
+        self.limiter.acquire(0)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        return self.acquire(blocking=blocking)
+
+
+class RateLimitCallbackHandler(BaseCallbackHandler):
+    '''
+    Debits the tokens a chat model call used from its RateLimiter, and slows
+    the limiter down when the provider rejects a call.
+    '''
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self.limiter.debit(usage.get("total_tokens") or 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if is_retryable(error):
+            self.limiter.throttled()
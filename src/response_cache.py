@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+CACHE_DIR = os.getenv("GEMINI_CACHE_DIR", os.path.join(".cache", "gemini"))
+CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_MB = float(os.getenv("GEMINI_CACHE_MAX_MB", "256"))
+CACHE_MEMORY_ITEMS = int(os.getenv("GEMINI_CACHE_MEMORY_ITEMS", "256"))
+CACHE_DISABLED = os.getenv("GEMINI_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+def _update_hash(digest, part):
+    '''
+    Feed one piece of generate_content input into the digest.
+    '''
+    if isinstance(part, str):
+        digest.update(b"s")
+        digest.update(part.encode("utf-8"))
+    elif isinstance(part, (bytes, bytearray, memoryview)):
+        digest.update(b"b")
+        digest.update(part)
+    elif isinstance(part, Image.Image):
+        digest.update(f"i{part.mode}{part.size}".encode())
+        digest.update(part.tobytes())
+    elif isinstance(part, dict):
+        digest.update(b"d")
+        for key in sorted(part):
+            digest.update(str(key).encode())
+            _update_hash(digest, part[key])
+    elif isinstance(part, (list, tuple)):
+        digest.update(f"l{len(part)}".encode())
+        for item in part:
+            _update_hash(digest, item)
+    else:
+        digest.update(repr(part).encode("utf-8"))
+
+
+def make_key(contents, model_name, generation_config=None):
+    '''
+    Content-addressed key for a (contents, model, generation config) request.
+    Images are hashed by their pixel data, so re-uploads of the same file hit.
+    '''
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(json.dumps(generation_config or {}, sort_keys=True, default=str).encode("utf-8"))
+    _update_hash(digest, contents)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    '''
+    Two-tier cache for model response text: an in-memory LRU in front of a
+    SQLite file. Entries expire after ttl seconds and the disk tier is trimmed
+    (least recently used first) once it grows past max_bytes.
+    '''
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+                 memory_items=CACHE_MEMORY_ITEMS, enabled=not CACHE_DISABLED):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0}
+
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "responses.sqlite3")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL, "
+            "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                text, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return text
+                del self._memory[key]
+
+            row = self._db.execute("SELECT text, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                text, created = row
+                if now - created <= self.ttl:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, text, created)
+                    self._counters["disk_hits"] += 1
+                    return text
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, text):
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._remember(key, text, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, text, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, text, now, now, size),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _remember(self, key, text, created):
+        self._memory[key] = (text, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+            self._memory.pop(key, None)
+        self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"], stats["disk_bytes"] = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    '''
+    Process-wide cache shared by every Streamlit session and rerun.
+    '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,59 @@
+import os
+import re
+
+# Rows of a directly rendered result kept in the chat history as markdown
+RESULT_MARKDOWN_ROWS = int(os.getenv("RESULT_MARKDOWN_ROWS", "20"))
+
+SCALAR = "scalar"
+TABLE = "table"
+EMPTY = "empty"
+INTERPRET = "interpret"
+
+# Questions asking for reasoning about the data rather than the data itself
+INTERPRET_WORDS = {
+    "why", "explain", "compare", "comparison", "trend", "trends", "summarize", "summarise", "summary",
+    "describe", "insight", "insights", "analyze", "analyse", "analysis", "interpret", "recommend",
+    "should", "suggest", "difference", "differences", "pattern", "patterns", "correlation",
+}
+
+
+def classify(result, question):
+    '''
+    Shape of a QueryResult for question: SCALAR (one value), TABLE (every row
+    is in the preview), EMPTY (no rows) or INTERPRET when the answer model is
+    needed: the question asks for reasoning, the statement returned no
+    result set, or the result is larger than the preview.
+    '''
+    words = set(re.findall(r"[a-z]+", question.lower()))
+    if words & INTERPRET_WORDS or not result.columns:
+        return INTERPRET
+    if result.rows_scanned == 0:
+        return EMPTY
+    if result.preview_truncated:
+        return INTERPRET
+    if result.rows_scanned == 1 and len(result.columns) == 1:
+        return SCALAR
+    return TABLE
+
+
+def _cell(value):
+    text = "" if value is None else str(value)
+    return text.replace("|", "\\|").replace("\n", " ")
+
+
+def to_markdown(result, shape, max_rows=RESULT_MARKDOWN_ROWS):
+    '''
+    Text stored in the chat history for a result that was rendered directly.
+    '''
+    if shape == EMPTY:
+        return "The query returned no rows."
+    if shape == SCALAR:
+        return f"**{result.columns[0]}**: {_cell(result.preview[0][0])}"
+    lines = [
+        "| " + " | ".join(_cell(column) for column in result.columns) + " |",
+        "| " + " | ".join("---" for _ in result.columns) + " |",
+    ]
+    lines.extend("| " + " | ".join(_cell(value) for value in row) + " |" for row in result.preview[:max_rows])
+    if len(result.preview) > max_rows:
+        lines.append(f"\n{len(result.preview) - max_rows} more row(s) not shown.")
+    return "\n".join(lines)
@@ -0,0 +1,94 @@
+import math
+import os
+import re
+from collections import Counter
+
+# Tables picked by relevance before foreign-key partners are added
+SCHEMA_TOP_K = int(os.getenv("SCHEMA_TOP_K", "5"))
+# Best BM25 score below which the full schema is used instead
+SCHEMA_MIN_SCORE = float(os.getenv("SCHEMA_MIN_SCORE", "1.0"))
+# Databases with at most this many tables always get the full schema
+SCHEMA_PRUNE_MIN_TABLES = int(os.getenv("SCHEMA_PRUNE_MIN_TABLES", "15"))
+
+# Table names count more than column names or comments
+TABLE_NAME_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def terms(text):
+    '''
+    Split identifiers and prose into lower-case terms: camelCase and
+    snake_case are broken up and a plural "s" is dropped (Tracks -> track).
+    '''
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    words = re.findall(r"[A-Za-z0-9]+", text)
+    result = []
+    for word in words:
+        word = word.lower()
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        result.append(word)
+    return result
+
+
+class SchemaIndex:
+    '''
+    BM25 index over table names, column names and comments, used to pick the
+    tables a question is about. Foreign-key neighbours of the picked tables
+    are added so the model can still write the joins.
+    '''
+
+    def __init__(self, catalog, top_k=SCHEMA_TOP_K, min_score=SCHEMA_MIN_SCORE, min_tables=SCHEMA_PRUNE_MIN_TABLES):
+        self.catalog = catalog
+        self.top_k = top_k
+        self.min_score = min_score
+        self.min_tables = min_tables
+        self._documents = {}
+        for name, table in catalog.items():
+            words = terms(name) * TABLE_NAME_WEIGHT + terms(table.comment)
+            for column, comment in zip(table.columns, table.column_comments):
+                words += terms(column) + terms(comment)
+            self._documents[name] = Counter(words)
+        lengths = [sum(document.values()) for document in self._documents.values()]
+        self._average_length = sum(lengths) / len(lengths) if lengths else 0.0
+        document_frequency = Counter()
+        for document in self._documents.values():
+            document_frequency.update(document.keys())
+        count = len(self._documents)
+        self._idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, question):
+        query = set(terms(question))
+        scores = {}
+        for name, document in self._documents.items():
+            length = sum(document.values())
+            score = 0.0
+            for term in query:
+                frequency = document.get(term)
+                if not frequency:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._average_length or 1))
+                score += self._idf[term] * frequency * (BM25_K1 + 1) / (frequency + norm)
+            if score > 0:
+                scores[name] = score
+        return scores
+
+    def select(self, question):
+        '''
+        Tables relevant to question plus their join partners, or None when
+        the full schema should be used (small database or low confidence).
+        '''
+        if len(self.catalog) <= self.min_tables:
+            return None
+        scores = self.scores(question)
+        if not scores or max(scores.values()) < self.min_score:
+            return None
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self.top_k]
+        selected = set(ranked)
+        for name in ranked:
+            selected |= self.catalog[name].neighbours
+        return selected
@@ -0,0 +1,168 @@
+import os
+import re
+
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+
+# LIMIT added to queries without one, and the cap applied to larger limits
+SQL_GUARD_LIMIT = int(os.getenv("SQL_GUARD_LIMIT", "1000"))
+# Queries MySQL expects to examine more rows than this are not run
+SQL_GUARD_MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", "1000000"))
+SQL_GUARD_EXPLAIN = os.getenv("SQL_GUARD_EXPLAIN", "1").lower() in ("1", "true", "yes")
+
+# Functions that block, touch files or take locks even inside a SELECT
+BLOCKED_FUNCTIONS = {"SLEEP", "BENCHMARK", "GET_LOCK", "RELEASE_LOCK", "LOAD_FILE", "SYS_EXEC", "SYS_EVAL"}
+# Parse error text: terminal underline escapes and sqlglot's Token reprs
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+TOKEN_REPR = re.compile(r"<Token token_type: [^,]*, text: (.*?), line: \d+.*?>")
+
+
+class SQLGuardError(ValueError):
+    '''
+    Raised when generated SQL may not run; sql is the offending query.
+    '''
+
+    def __init__(self, message, sql):
+        super().__init__(message)
+        self.sql = sql
+
+
+class GuardedQuery:
+    '''
+    SQL that passed the guard, with what was changed and what it may cost.
+    '''
+
+    def __init__(self, sql, original, limit_added=False, limit_capped=False, estimated_rows=None):
+        self.sql = sql
+        self.original = original
+        self.limit_added = limit_added
+        self.limit_capped = limit_capped
+        self.estimated_rows = estimated_rows
+
+    def describe(self):
+        if self.estimated_rows is None:
+            parts = ["No cost estimate"]
+        else:
+            parts = [f"Estimated rows examined: ~{self.estimated_rows:,.0f}"]
+        if self.limit_added:
+            parts.append(f"LIMIT {SQL_GUARD_LIMIT} added")
+        if self.limit_capped:
+            parts.append(f"LIMIT capped at {SQL_GUARD_LIMIT}")
+        return ", ".join(parts) + "."
+
+
+def parse_error_message(error):
+    '''
+    Plain-text summary of a sqlglot ParseError. str(error) underlines the
+    failing token with terminal escapes and repeats the query around it.
+    '''
+    details = []
+    for item in error.errors[:3]:
+        description = TOKEN_REPR.sub(lambda m: repr(m.group(1)), item.get("description") or "invalid syntax")
+        details.append(f"{description} (line {item.get('line')}, column {item.get('col')})")
+    return "; ".join(details) or ANSI_ESCAPE.sub("", str(error))
+
+
+def _parse(sql, dialect):
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read=dialect) if statement is not None]
+    except sqlglot.errors.ParseError as e:
+        raise SQLGuardError(f"Could not parse the query: {parse_error_message(e)}", sql) from e
+    if len(statements) != 1:
+        raise SQLGuardError("Only a single statement can be run.", sql)
+    return statements[0]
+
+
+def _check_read_only(statement, sql):
+    if not isinstance(statement, (exp.Select, exp.SetOperation)):
+        raise SQLGuardError(f"Only SELECT queries can be run, not {statement.key.upper()}.", sql)
+    for node in statement.walk():
+        if isinstance(node, (exp.Into, exp.Lock)):
+            raise SQLGuardError("SELECT ... INTO and locking reads are not allowed.", sql)
+        if isinstance(node, (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter, exp.Command)):
+            raise SQLGuardError("Queries that modify data or schema are not allowed.", sql)
+        if isinstance(node, exp.Func):
+            name = node.name.upper() if isinstance(node, exp.Anonymous) else node.sql_name()
+            if name in BLOCKED_FUNCTIONS:
+                raise SQLGuardError(f"{name}() is not allowed.", sql)
+
+
+def _apply_limit(statement, limit):
+    '''
+    Returns (statement, added, capped). Only literal limits can be capped.
+    '''
+    current = statement.args.get("limit")
+    if current is None:
+        return statement.limit(limit), True, False
+    if isinstance(current, exp.Fetch):
+        # FETCH FIRST n ROWS ONLY: rewritten as LIMIT n, capped like any other limit
+        count = current.args.get("count") or exp.Literal.number(1)
+        if not (isinstance(count, exp.Literal) and count.is_int):
+            return statement, False, False
+        if int(count.name) > limit:
+            return statement.limit(limit), False, True
+        return statement.limit(int(count.name)), False, False
+    value = current.expression
+    if isinstance(value, exp.Literal) and value.is_int and int(value.name) > limit:
+        return statement.limit(limit), False, True
+    return statement, False, False
+
+
+def estimate_rows(db, sql):
+    '''
+    Rows MySQL expects to examine, from the traditional EXPLAIN output: within
+    each SELECT the tables are joined in order, so each table is examined once
+    per row surviving the tables before it. None if there is no estimate.
+    '''
+    if db.dialect != "mysql":
+        return None
+    with db._engine.connect() as connection:
+        plan = connection.execute(text(f"EXPLAIN {sql}")).mappings().all()
+    selects = {}
+    for row in plan:
+        if row.get("rows") is None:
+            continue
+        prefix, total = selects.get(row["id"], (1.0, 0.0))
+        examined = prefix * float(row["rows"])
+        filtered = float(row.get("filtered") or 100.0)
+        selects[row["id"]] = (examined * filtered / 100.0, total + examined)
+    if not selects:
+        return None
+    return sum(total for _, total in selects.values())
+
+
+def guard_sql(db, sql, limit=SQL_GUARD_LIMIT, max_rows=SQL_GUARD_MAX_ROWS, explain=SQL_GUARD_EXPLAIN):
+    '''
+    Check that sql is a single read-only SELECT, bound its result with a
+    LIMIT and, on MySQL, reject it when EXPLAIN estimates more than max_rows
+    examined rows. Nothing but EXPLAIN touches the database.
+    '''
+    sql = sql.strip().rstrip(";").strip()
+    statement = _parse(sql, db.dialect)
+    _check_read_only(statement, sql)
+
+    limit_added = limit_capped = False
+    if limit:
+        statement, limit_added, limit_capped = _apply_limit(statement, limit)
+    # Keep the model's text unless it was rewritten
+    guarded = statement.sql(dialect=db.dialect) if limit_added or limit_capped else sql
+
+    query = GuardedQuery(guarded, sql, limit_added, limit_capped)
+    if explain:
+        check_cost(db, query, max_rows)
+    return query
+
+
+def check_cost(db, query, max_rows=SQL_GUARD_MAX_ROWS):
+    '''
+    Fill in query.estimated_rows and raise SQLGuardError above max_rows.
+    '''
+    query.estimated_rows = estimate_rows(db, query.sql)
+    if query.estimated_rows is not None and max_rows and query.estimated_rows > max_rows:
+        raise SQLGuardError(
+            f"The query would examine about {query.estimated_rows:,.0f} rows (limit {max_rows:,}). "
+            "Try a narrower question.",
+            query.sql,
+        )
+    return query
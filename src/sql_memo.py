@@ -0,0 +1,151 @@
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from difflib import SequenceMatcher
+
+# Minimum similarity (0-1) for a fuzzy match to reuse earlier SQL
+SQL_MEMO_THRESHOLD = float(os.getenv("SQL_MEMO_THRESHOLD", "0.92"))
+# Earlier user questions that are part of the memo key (follow-ups depend on them)
+SQL_MEMO_HISTORY_TURNS = int(os.getenv("SQL_MEMO_HISTORY_TURNS", "2"))
+SQL_MEMO_ITEMS = int(os.getenv("SQL_MEMO_ITEMS", "2000"))
+# Off by default: near-identical wording can still ask a different question
+SQL_MEMO_FUZZY = os.getenv("SQL_MEMO_FUZZY", "0").lower() in ("1", "true", "yes")
+
+FILLER_WORDS = {"please", "can", "could", "you", "show", "me", "tell", "give", "list", "the", "a", "an", "of", "all"}
+# Words that flip a question's meaning; a fuzzy match never differs in one
+MEANING_WORDS = {
+    "not", "no", "never", "none", "nobody", "nothing", "without", "except", "excluding", "neither", "nor",
+    "cannot", "don", "doesn", "didn", "isn", "aren", "wasn", "weren", "haven", "hasn", "hadn", "won",
+    "wouldn", "shouldn", "couldn",
+    "ascending", "descending", "asc", "desc", "most", "least", "highest", "lowest", "top", "bottom",
+    "first", "last", "largest", "smallest", "max", "min", "maximum", "minimum", "more", "less", "fewer",
+    "before", "after", "above", "below", "over", "under", "oldest", "newest", "earliest", "latest",
+}
+LITERAL = re.compile(r"\d+(?:\.\d+)?|'[^']*'|\"[^\"]*\"")
+
+
+def normalize_question(question):
+    '''
+    Lexical normal form: lower case, punctuation and filler words dropped,
+    whitespace collapsed. Quoted values and numbers are kept verbatim.
+    '''
+    literals = LITERAL.findall(question)
+    words = re.findall(r"[a-z0-9_]+", LITERAL.sub(" ", question.lower()))
+    words = [word for word in words if word not in FILLER_WORDS]
+    return " ".join(words + literals)
+
+
+def literals(question):
+    # Numbers and quoted values must match exactly: "top 5" never reuses "top 10"
+    return tuple(sorted(LITERAL.findall(question)))
+
+
+def history_key(chat_history, question, turns=SQL_MEMO_HISTORY_TURNS):
+    '''
+    Normalized text of the previous user questions in chat_history (messages
+    with type "human"), excluding the current question.
+    '''
+    questions = [message.content for message in chat_history if getattr(message, "type", None) == "human"]
+    if questions and questions[-1] == question:
+        questions = questions[:-1]
+    if turns <= 0:
+        return ""
+    return " | ".join(normalize_question(q) for q in questions[-turns:])
+
+
+def changes_meaning(first, second):
+    # True when the normalized questions differ in a negation, direction or comparison word
+    return bool((set(first.split()) ^ set(second.split())) & MEANING_WORDS)
+
+
+class SQLMemo:
+    '''
+    Maps (schema fingerprint, recent questions, question) to the SQL that was
+    generated for it. Exact normalized matches always hit; with fuzzy=True an
+    inverted token index finds near-identical questions scoring at least
+    threshold that differ in no negation or sort-direction word. Entries
+    for any other schema fingerprint are dropped as soon as a new
+    fingerprint is seen.
+    '''
+
+    def __init__(self, threshold=SQL_MEMO_THRESHOLD, max_items=SQL_MEMO_ITEMS, fuzzy=SQL_MEMO_FUZZY):
+        self.threshold = threshold
+        self.max_items = max_items
+        self.fuzzy = fuzzy
+        self._entries = OrderedDict()   # (fingerprint, history, question) -> (sql, literals)
+        self._index = defaultdict(set)  # (fingerprint, history, token) -> keys
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "fuzzy_hits": 0, "misses": 0, "invalidated": 0}
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            if self._fingerprint is not None:
+                self._counters["invalidated"] += len(self._entries)
+            self._entries.clear()
+            self._index.clear()
+            self._fingerprint = fingerprint
+
+    def lookup(self, question, chat_history, fingerprint):
+        '''
+        Return (sql, confidence) for a memoized question or (None, 0.0).
+        '''
+        normalized = normalize_question(question)
+        history = history_key(chat_history, question)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = (fingerprint, history, normalized)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._counters["exact_hits"] += 1
+                return self._entries[key][0], 1.0
+
+            if self.fuzzy:
+                wanted = literals(question)
+                candidates = set()
+                for token in normalized.split():
+                    candidates |= self._index.get((fingerprint, history, token), set())
+                best, best_score = None, 0.0
+                for candidate in candidates:
+                    sql, candidate_literals = self._entries[candidate]
+                    if candidate_literals != wanted or changes_meaning(normalized, candidate[2]):
+                        continue
+                    score = SequenceMatcher(None, normalized, candidate[2]).ratio()
+                    if score > best_score:
+                        best, best_score = sql, score
+                if best is not None and best_score >= self.threshold:
+                    self._counters["fuzzy_hits"] += 1
+                    return best, best_score
+
+            self._counters["misses"] += 1
+            return None, 0.0
+
+    def store(self, question, chat_history, fingerprint, sql):
+        normalized = normalize_question(question)
+        history = history_key(chat_history, question)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            key = (fingerprint, history, normalized)
+            self._entries[key] = (sql, literals(question))
+            self._entries.move_to_end(key)
+            for token in normalized.split():
+                self._index[(fingerprint, history, token)].add(key)
+            while len(self._entries) > self.max_items:
+                self._forget(next(iter(self._entries)))
+
+    def _forget(self, key):
+        del self._entries[key]
+        fingerprint, history, normalized = key
+        for token in normalized.split():
+            keys = self._index.get((fingerprint, history, token))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(fingerprint, history, token)]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        return stats
@@ -0,0 +1,186 @@
+import os
+from collections import Counter
+
+from sqlalchemy import text
+
+# Rows and bytes of the result that are pasted into the answer prompt
+RESULT_PREVIEW_ROWS = int(os.getenv("RESULT_PREVIEW_ROWS", "50"))
+RESULT_PREVIEW_KB = int(os.getenv("RESULT_PREVIEW_KB", "16"))
+# Rows read from the server before streaming stops
+RESULT_SCAN_ROWS = int(os.getenv("RESULT_SCAN_ROWS", "100000"))
+# Rows fetched from the server per round trip while streaming
+STREAM_BATCH_ROWS = 1000
+# Longest value shown in the preview (same limit SQLDatabase.run applies)
+MAX_VALUE_LENGTH = 300
+TOP_K = 5
+
+
+def _truncate(value):
+    if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+        return value[:MAX_VALUE_LENGTH - 3] + "..."
+    return value
+
+
+class ColumnSummary:
+    '''
+    Single-pass column statistics: non-null count, nulls, min/max and an
+    approximate top-k of frequent values (Misra-Gries, so memory stays
+    bounded however many distinct values stream past).
+    '''
+
+    def __init__(self, name, k=TOP_K):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self._capacity = k * 10
+        self._k = k
+        self._counters = Counter()
+
+    def add(self, value):
+        if value is None:
+            self.nulls += 1
+            return
+        self.count += 1
+        try:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        except TypeError:
+            pass  # Mixed types: keep the bounds seen so far
+
+        value = _truncate(value)
+        if value in self._counters or len(self._counters) < self._capacity:
+            self._counters[value] += 1
+        else:
+            for key in list(self._counters):
+                self._counters[key] -= 1
+                if self._counters[key] <= 0:
+                    del self._counters[key]
+
+    def top(self):
+        return self._counters.most_common(self._k)
+
+    def describe(self):
+        parts = [f"{self.count} values", f"{self.nulls} nulls"]
+        if self.min is not None:
+            parts.append(f"min {_truncate(self.min)!r}, max {_truncate(self.max)!r}")
+        top = self.top()
+        if top and top[0][1] > 1:
+            parts.append("most frequent " + ", ".join(f"{value!r} (~{count})" for value, count in top))
+        return f"{self.name}: " + "; ".join(parts)
+
+
+class QueryResult:
+    '''
+    Bounded view of a query result: a preview of the first rows plus column
+    summaries over everything that was scanned. str() gives the compact
+    text that goes into the answer prompt.
+    '''
+
+    def __init__(self, columns, preview, rows_scanned, scan_truncated, preview_truncated, summaries):
+        self.columns = columns
+        self.preview = preview
+        self.rows_scanned = rows_scanned
+        self.scan_truncated = scan_truncated
+        self.preview_truncated = preview_truncated
+        self.summaries = summaries
+
+    def __str__(self):
+        if not self.columns:
+            return ""
+        if self.rows_scanned == 0:
+            return f"Columns: {', '.join(self.columns)}\nNo rows."
+
+        total = f"at least {self.rows_scanned}" if self.scan_truncated else str(self.rows_scanned)
+        lines = [f"Columns: {', '.join(self.columns)}"]
+        if self.preview_truncated:
+            lines.append(f"First {len(self.preview)} of {total} rows:")
+        else:
+            lines.append(f"All {total} rows:")
+        lines.extend(str(row) for row in self.preview)
+        if self.preview_truncated:
+            lines.append("Summary of all scanned rows:")
+            lines.extend(f"- {summary.describe()}" for summary in self.summaries)
+        return "\n".join(lines)
+
+
+def _open_unbuffered(connection, sql):
+    '''
+    mysqlconnector ignores stream_results: SQLAlchemy's cursors for it are
+    buffered, so the whole result would reach client memory before the first
+    row is read. An unbuffered DBAPI cursor reads rows off the socket instead.
+    Returns (columns, rows, cursor); columns is None when nothing is returned.
+    '''
+    cursor = connection.connection.driver_connection.cursor(buffered=False)
+    cursor.execute(sql)
+    if cursor.description is None:
+        return None, None, cursor
+
+    def rows():
+        while True:
+            batch = cursor.fetchmany(STREAM_BATCH_ROWS)
+            if not batch:
+                return
+            yield from batch
+
+    return [column[0] for column in cursor.description], rows(), cursor
+
+
+def _open_streamed(connection, sql):
+    result = connection.execution_options(stream_results=True, max_row_buffer=STREAM_BATCH_ROWS).execute(text(sql))
+    if not result.returns_rows:
+        return None, None, result
+    return list(result.keys()), result, result
+
+
+def stream_query(db, sql, preview_rows=None, preview_kb=None, scan_rows=None):
+    '''
+    Run sql reading rows from the server as they are consumed (a server-side
+    cursor, or an unbuffered one on mysqlconnector) and build a QueryResult
+    in a single pass, never holding more than the preview in memory.
+    Reading stops after scan_rows rows.
+    '''
+    preview_rows = preview_rows or RESULT_PREVIEW_ROWS
+    preview_bytes = (preview_kb or RESULT_PREVIEW_KB) * 1024
+    scan_rows = scan_rows or RESULT_SCAN_ROWS
+
+    preview, preview_size, rows_scanned = [], 0, 0
+    preview_truncated = scan_truncated = False
+    with db._engine.connect() as connection:
+        unbuffered = connection.dialect.driver == "mysqlconnector"
+        columns, rows, cursor = (_open_unbuffered if unbuffered else _open_streamed)(connection, sql)
+        if columns is None:
+            cursor.close()
+            connection.commit()
+            return QueryResult([], [], 0, False, False, [])
+        summaries = [ColumnSummary(column) for column in columns]
+        completed = False
+        try:
+            for row in rows:
+                if rows_scanned >= scan_rows:
+                    scan_truncated = True
+                    break
+                rows_scanned += 1
+                for summary, value in zip(summaries, row):
+                    summary.add(value)
+                if not preview_truncated:
+                    shown = tuple(_truncate(value) for value in row)
+                    size = len(str(shown))
+                    if len(preview) < preview_rows and preview_size + size <= preview_bytes:
+                        preview.append(shown)
+                        preview_size += size
+                    else:
+                        preview_truncated = True
+            completed = not scan_truncated
+        finally:
+            if unbuffered and not completed:
+                # Unread rows would have to be drained off the socket first;
+                # dropping the connection is cheaper than reading them
+                connection.invalidate()
+            else:
+                cursor.close()
+
+    return QueryResult(columns, preview, rows_scanned, scan_truncated, preview_truncated or scan_truncated, summaries)
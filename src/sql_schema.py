@@ -0,0 +1,229 @@
+import hashlib
+import os
+import threading
+import time
+
+from sqlalchemy import inspect, text
+
+from src.schema_index import SchemaIndex
+from src.sql_validate import SQLValidator
+
+# Seconds between information_schema checksum checks of a cached snapshot
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "30"))
+
+MYSQL_CHECKSUM_QUERY = """
+SELECT t.TABLE_NAME, t.CREATE_TIME, t.UPDATE_TIME, COUNT(c.COLUMN_NAME)
+FROM information_schema.TABLES t
+LEFT JOIN information_schema.COLUMNS c
+    ON c.TABLE_SCHEMA = t.TABLE_SCHEMA AND c.TABLE_NAME = t.TABLE_NAME
+WHERE t.TABLE_SCHEMA = DATABASE()
+GROUP BY t.TABLE_NAME, t.CREATE_TIME, t.UPDATE_TIME
+ORDER BY t.TABLE_NAME
+"""
+
+SQLITE_CHECKSUM_QUERY = "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') ORDER BY name"
+
+MYSQL_COLUMNS_QUERY = """
+SELECT TABLE_NAME, COLUMN_NAME, COLUMN_COMMENT
+FROM information_schema.COLUMNS
+WHERE TABLE_SCHEMA = DATABASE()
+ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+MYSQL_TABLES_QUERY = """
+SELECT TABLE_NAME, TABLE_COMMENT FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()
+"""
+
+MYSQL_FOREIGN_KEYS_QUERY = """
+SELECT TABLE_NAME, REFERENCED_TABLE_NAME
+FROM information_schema.KEY_COLUMN_USAGE
+WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+"""
+
+
+def db_key(db):
+    '''
+    Stable identifier for the database behind a SQLDatabase, used to share
+    cached resources between sessions connected to the same DSN.
+    '''
+    url = db._engine.url.render_as_string(hide_password=False)
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def table_versions(db):
+    '''
+    Cheap catalogue probe: {table name: (structure version, data version)}.
+
+    On MySQL the structure version is create time plus column count and the
+    data version is UPDATE_TIME (None when the engine does not track it). On
+    SQLite the structure version is the table DDL; other dialects fall back
+    to reflected column counts. Neither tracks a data version.
+    '''
+    with db._engine.connect() as connection:
+        if db.dialect == "mysql":
+            if (connection.dialect.server_version_info or (0,)) >= (8,):
+                # MySQL 8 serves UPDATE_TIME from a statistics cache refreshed
+                # once a day by default; read the current values instead
+                connection.execute(text("SET SESSION information_schema_stats_expiry = 0"))
+            rows = connection.execute(text(MYSQL_CHECKSUM_QUERY)).fetchall()
+            return {
+                name: (f"{created}|{columns}", str(updated) if updated is not None else None)
+                for name, created, updated, columns in rows
+            }
+        if db.dialect == "sqlite":
+            rows = connection.execute(text(SQLITE_CHECKSUM_QUERY)).fetchall()
+            return {name: (hashlib.sha1((sql or "").encode("utf-8")).hexdigest(), None) for name, sql in rows}
+        inspector = inspect(connection)
+        return {name: (str(len(inspector.get_columns(name))), None) for name in inspector.get_table_names()}
+
+
+class TableCatalog:
+    '''
+    Lightweight description of one table: columns, comments and the tables
+    it is linked to by foreign keys (in either direction).
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.comment = ""
+        self.columns = []
+        self.column_comments = []
+        self.neighbours = set()
+
+
+def load_catalog(db):
+    '''
+    {table name: TableCatalog} for the usable tables of db. MySQL needs three
+    information_schema queries; other dialects go through the SQLAlchemy
+    inspector.
+    '''
+    usable = set(db.get_usable_table_names())
+    catalog = {name: TableCatalog(name) for name in usable}
+    with db._engine.connect() as connection:
+        if db.dialect == "mysql":
+            for table, column, comment in connection.execute(text(MYSQL_COLUMNS_QUERY)):
+                if table in catalog:
+                    catalog[table].columns.append(column)
+                    catalog[table].column_comments.append(comment or "")
+            for table, comment in connection.execute(text(MYSQL_TABLES_QUERY)):
+                if table in catalog:
+                    catalog[table].comment = comment or ""
+            foreign_keys = list(connection.execute(text(MYSQL_FOREIGN_KEYS_QUERY)))
+        else:
+            inspector = inspect(connection)
+            foreign_keys = []
+            for table in catalog.values():
+                for column in inspector.get_columns(table.name):
+                    table.columns.append(column["name"])
+                    table.column_comments.append(column.get("comment") or "")
+                for foreign_key in inspector.get_foreign_keys(table.name):
+                    foreign_keys.append((table.name, foreign_key["referred_table"]))
+    for table, referenced in foreign_keys:
+        if table in catalog and referenced in catalog and table != referenced:
+            catalog[table].neighbours.add(referenced)
+            catalog[referenced].neighbours.add(table)
+    return catalog
+
+
+def checksum(versions):
+    digest = hashlib.sha256()
+    for name in sorted(versions):
+        digest.update(f"{name}={versions[name]};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SchemaSnapshot:
+    def __init__(self, table_info, versions, catalog, build_seconds):
+        self.table_info = table_info
+        self.versions = versions
+        self.catalog = catalog
+        self.index = SchemaIndex(catalog)
+        self.validator = SQLValidator(catalog)
+        # db.get_table_info() for subsets of tables, filled on demand
+        self.partial_info = {}
+        self.checksum = checksum(versions)
+        # Ignores data versions: only changes when tables or columns change
+        self.structure_checksum = checksum({name: version[0] for name, version in versions.items()})
+        self.built_at = time.time()
+        self.build_seconds = build_seconds
+
+
+class SchemaCache:
+    '''
+    Per-connection snapshot of db.get_table_info().
+
+    The expensive introspection runs once; afterwards the snapshot is reused
+    until the information_schema checksum (table list, create/update times,
+    column counts) changes. The checksum itself is probed at most once every
+    check_interval seconds.
+    '''
+
+    def __init__(self, db, check_interval=SCHEMA_CHECK_INTERVAL):
+        self.db = db
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"builds": 0, "checks": 0, "hits": 0, "pruned_schema": 0, "full_schema": 0}
+
+    def snapshot(self):
+        with self._lock:
+            now = time.time()
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                self._counters["hits"] += 1
+                return self._snapshot
+
+            versions = table_versions(self.db)
+            self._checked_at = now
+            self._counters["checks"] += 1
+            if self._snapshot is not None and checksum(versions) == self._snapshot.checksum:
+                self._counters["hits"] += 1
+                return self._snapshot
+            return self._build(versions)
+
+    def get(self):
+        return self.snapshot().table_info
+
+    def relevant(self, question):
+        '''
+        Schema text limited to the tables relevant to question, or the full
+        schema when the index is not confident (see SchemaIndex.select).
+        '''
+        snapshot = self.snapshot()
+        tables = snapshot.index.select(question)
+        if tables is None:
+            with self._lock:
+                self._counters["full_schema"] += 1
+            return snapshot.table_info
+        key = frozenset(tables)
+        with self._lock:
+            self._counters["pruned_schema"] += 1
+            info = snapshot.partial_info.get(key)
+        if info is None:
+            info = self.db.get_table_info(table_names=sorted(tables))
+            with self._lock:
+                snapshot.partial_info[key] = info
+        return info
+
+    def refresh(self):
+        with self._lock:
+            self._checked_at = time.time()
+            return self._build(table_versions(self.db))
+
+    def _build(self, versions):
+        started = time.perf_counter()
+        table_info = self.db.get_table_info()
+        catalog = load_catalog(self.db)
+        self._snapshot = SchemaSnapshot(table_info, versions, catalog, time.perf_counter() - started)
+        self._counters["builds"] += 1
+        return self._snapshot
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._counters)
+            snapshot = self._snapshot
+        if snapshot is not None:
+            metrics["tables"] = len(snapshot.versions)
+            metrics["age_seconds"] = time.time() - snapshot.built_at
+            metrics["last_build_seconds"] = snapshot.build_seconds
+        return metrics
@@ -0,0 +1,156 @@
+import difflib
+import os
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ErrorLevel, OptimizeError, UnsupportedError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.schema import MappingSchema
+from sqlglot.tokens import TokenType
+
+from src.sql_guard import SQLGuardError, parse_error_message
+
+# Repair calls to the LLM before a query that fails validation is given up on
+SQL_REPAIR_ATTEMPTS = int(os.getenv("SQL_REPAIR_ATTEMPTS", "2"))
+
+# Messages from sqlglot's qualifier that mean a column does not exist
+UNRESOLVED_COLUMN = ("could not be resolved", "Unknown column")
+
+# sqlglot reads these leniently and would rewrite them, but the database
+# itself rejects them: (dialect, token type) -> what to use instead
+FOREIGN_SYNTAX = {
+    "mysql": {
+        TokenType.DCOLON: "'::' casts are not MySQL syntax; use CAST(x AS type).",
+        TokenType.ILIKE: "ILIKE is not MySQL syntax; use LIKE, which ignores case with the default collation.",
+        TokenType.FETCH: "FETCH FIRST n ROWS ONLY is not MySQL syntax; use LIMIT n.",
+    },
+}
+# (dialect, function name) -> what to use instead
+FOREIGN_FUNCTIONS = {
+    "mysql": {
+        "DATE_TRUNC": "use DATE_FORMAT(date, '%Y-%m-01') or YEAR()/MONTH()",
+        "STRING_AGG": "use GROUP_CONCAT(x SEPARATOR ',')",
+        "ARRAY_AGG": "use GROUP_CONCAT",
+        "TO_CHAR": "use DATE_FORMAT or FORMAT",
+        "TO_DATE": "use STR_TO_DATE",
+        "DATEADD": "use DATE_ADD(date, INTERVAL n unit)",
+        "DATEPART": "use EXTRACT(unit FROM date) or YEAR()/MONTH()/DAY()",
+        "GETDATE": "use NOW()",
+        "NVL": "use IFNULL",
+        "GENERATE_SERIES": "use a recursive CTE",
+    },
+}
+
+
+class SQLValidationError(SQLGuardError):
+    '''
+    Raised when generated SQL does not parse or refers to tables or columns
+    that are not in the schema, and repairing it did not help.
+    '''
+
+
+def _lower_identifiers(statement):
+    # MySQL column names are case-insensitive; table names are on most installs
+    for identifier in statement.find_all(exp.Identifier):
+        identifier.set("this", identifier.this.lower())
+    return statement
+
+
+def _foreign_syntax(sql, dialect):
+    '''
+    Message naming the first construct in sql that the dialect's database
+    would reject although sqlglot parses it, or None.
+    '''
+    syntax = FOREIGN_SYNTAX.get(dialect, {})
+    functions = FOREIGN_FUNCTIONS.get(dialect, {})
+    if not syntax and not functions:
+        return None
+    tokens = sqlglot.Dialect.get_or_raise(dialect).tokenize(sql)
+    for token, following in zip(tokens, tokens[1:] + [None]):
+        if token.token_type in syntax:
+            return f"Not valid {dialect}: {syntax[token.token_type]}"
+        name = token.text.upper()
+        if token.token_type == TokenType.VAR and name in functions and following is not None \
+                and following.token_type == TokenType.L_PAREN:
+            return f"Not valid {dialect}: {name}() does not exist; {functions[name]}."
+    return None
+
+
+class SQLValidator:
+    '''
+    Checks SQL against a schema catalog ({table: TableCatalog}) without
+    touching the database: it must parse in the database's dialect, use no
+    syntax or functions of other dialects, and every table and column it
+    names must exist. validate() returns None for valid
+    SQL, otherwise an error message precise enough for the model to fix it.
+    '''
+
+    def __init__(self, catalog):
+        self.catalog = {name.lower(): table for name, table in catalog.items()}
+        self._schemas = {}
+
+    def _schema(self, dialect):
+        if dialect not in self._schemas:
+            mapping = {
+                name: {column.lower(): "UNKNOWN" for column in table.columns}
+                for name, table in self.catalog.items()
+            }
+            self._schemas[dialect] = MappingSchema(mapping, dialect=dialect)
+        return self._schemas[dialect]
+
+    def _suggest(self, word, choices):
+        matches = difflib.get_close_matches(word.lower(), [choice.lower() for choice in choices], n=1)
+        if not matches:
+            return ""
+        original = next(choice for choice in choices if choice.lower() == matches[0])
+        return f" Did you mean {original}?"
+
+    def validate(self, sql, dialect):
+        try:
+            statements = [statement for statement in sqlglot.parse(sql, read=dialect) if statement is not None]
+        except sqlglot.errors.ParseError as e:
+            return f"Syntax error for {dialect}: {parse_error_message(e)}"
+        if len(statements) != 1:
+            return "Expected exactly one SQL statement."
+        statement = statements[0]
+        # sqlglot's fallbacks for text it could not read as a statement
+        if isinstance(statement, (exp.Alias, exp.Column, exp.Identifier, exp.Command)):
+            return f"Syntax error for {dialect}: '{sql[:80]}' is not a valid statement."
+        foreign = _foreign_syntax(sql, dialect)
+        if foreign is not None:
+            return foreign
+        try:
+            statement.sql(dialect=dialect, unsupported_level=ErrorLevel.RAISE)
+        except UnsupportedError as e:
+            return f"Not valid {dialect}: {e}"
+
+        ctes = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+        tables = []
+        for table in statement.find_all(exp.Table):
+            name = table.name.lower()
+            if name in ctes or not name:
+                continue
+            if name not in self.catalog:
+                known = [entry.name for entry in self.catalog.values()]
+                return f"Unknown table '{table.name}'.{self._suggest(table.name, known)}"
+            tables.append(self.catalog[name])
+
+        try:
+            qualify(
+                _lower_identifiers(statement.copy()),
+                schema=self._schema(dialect),
+                dialect=dialect,
+                validate_qualify_columns=True,
+                quote_identifiers=False,
+            )
+        except OptimizeError as e:
+            message = str(e)
+            if not any(marker in message for marker in UNRESOLVED_COLUMN):
+                return None  # Construct the qualifier cannot follow; leave it to the database
+            columns = ", ".join(
+                f"{table.name}({', '.join(table.columns)})" for table in dict.fromkeys(tables)
+            )
+            return f"{message}. Columns of the tables used: {columns}"
+        except Exception:
+            return None
+        return None
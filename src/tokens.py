@@ -0,0 +1,7 @@
+# Gemini bills a fixed number of tokens per image
+IMAGE_TOKENS = 258
+
+
+def estimate_tokens(text):
+    # Rough English average of four characters per token
+    return len(text) // 4 + 1
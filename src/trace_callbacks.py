@@ -0,0 +1,61 @@
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.tokens import estimate_tokens
+from src.tracing import current_session, get_tracer
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    '''
+    Records every LangChain chat model call (invoke and stream) with the
+    tracer: prompt tokens (estimated unless the provider reports usage),
+    latency, time to first token and errors.
+    '''
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer or get_tracer()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, **kwargs):
+        params = invocation_params or {}
+        model = params.get("model") or params.get("model_name") or (serialized or {}).get("name", "llm")
+        prompt = "\n".join(str(message.content) for batch in messages for message in batch)
+        with self._lock:
+            self._calls[run_id] = {
+                "model": model,
+                "started": time.perf_counter(),
+                "ttft": None,
+                "prompt_tokens": estimate_tokens(prompt),
+                # Callbacks may fire on LangChain's worker threads
+                "session": current_session.get(),
+            }
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        call = self._calls.get(run_id)
+        if call is not None and call["ttft"] is None:
+            call["ttft"] = time.perf_counter() - call["started"]
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self.tracer.record(
+            "llm", call["model"], time.perf_counter() - call["started"], ttft=call["ttft"],
+            prompt_tokens=usage.get("prompt_tokens") or call["prompt_tokens"],
+            output_tokens=usage.get("completion_tokens") or 0, session=call["session"],
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        self.tracer.record(
+            "llm", call["model"], time.perf_counter() - call["started"], ttft=call["ttft"],
+            prompt_tokens=call["prompt_tokens"], error=type(error).__name__, session=call["session"],
+        )
@@ -0,0 +1,54 @@
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from src.prompts import prompt_stats
+from src.rate_limit import rate_limiter_stats
+from src.tracing import current_session, get_tracer
+
+
+def bind_session():
+    '''
+    Attribute the calls made by this script run to the Streamlit session.
+    Call at the top of every app.
+    '''
+    ctx = get_script_run_ctx()
+    session = ctx.session_id if ctx is not None else "local"
+    current_session.set(session)
+    return session
+
+
+def show_trace_panel():
+    '''
+    Sidebar panel with per-model call aggregates and JSONL/Prometheus exports.
+    '''
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return
+    with st.sidebar.expander("Call metrics"):
+        session_only = st.toggle("This session only", value=True, key="trace_session_only")
+        session = current_session.get() if session_only else None
+        rows = tracer.summary(session)
+        if not rows:
+            st.caption("No model or database calls yet.")
+            return
+        st.dataframe(pd.DataFrame(rows).round(3), hide_index=True)
+        limits = rate_limiter_stats()
+        if limits:
+            # Process-wide: the queue is shared by every session
+            st.caption("Rate limiters (all sessions)")
+            st.dataframe(pd.DataFrame(limits).round(3), hide_index=True,
+                         column_order=("name", "rpm", "tpm", "waiting", "max_waiting", "waited_seconds",
+                                       "throttled", "retries", "acquired", "tokens"))
+        prompts = prompt_stats()
+        if prompts:
+            st.caption("Fixed prompts (all sessions)")
+            st.dataframe(pd.DataFrame(prompts), hide_index=True)
+        st.download_button(
+            "Export JSONL", tracer.to_jsonl(session), file_name="calls.jsonl",
+            mime="application/jsonl", key="trace_export_jsonl",
+        )
+        st.download_button(
+            "Export Prometheus", tracer.to_prometheus(), file_name="metrics.prom",
+            mime="text/plain", key="trace_export_prometheus",
+        )
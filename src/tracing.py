@@ -0,0 +1,217 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Call records kept in memory for the sidebar panel and exports
+TRACE_MAX_RECORDS = int(os.getenv("TRACE_MAX_RECORDS", "5000"))
+# If set, every record is also appended to this JSONL file
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_DISABLED = os.getenv("TRACE_DISABLED", "").lower() in ("1", "true", "yes")
+
+# Streamlit session the current thread works for (copied into worker threads)
+current_session = contextvars.ContextVar("current_session", default="local")
+
+FIELDS = ("calls", "errors", "cache_hits", "retries", "prompt_tokens", "output_tokens", "image_bytes", "latency")
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class TracedStream:
+    '''
+    Wraps a streamed response: the call is recorded once iteration ends,
+    with the time to the first chunk as ttft.
+    '''
+
+    def __init__(self, response, tracer, call, started):
+        self._response = response
+        self._tracer = tracer
+        self._call = call
+        self._started = started
+
+    def __iter__(self):
+        try:
+            for chunk in self._response:
+                if self._call.get("ttft") is None:
+                    self._call["ttft"] = time.perf_counter() - self._started
+                yield chunk
+        except Exception as e:
+            self._call["error"] = type(e).__name__
+            raise
+        finally:
+            self._call["latency"] = time.perf_counter() - self._started
+            self._tracer.record(**self._call)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class Tracer:
+    '''
+    Process-wide record of model and database calls: per call the kind
+    (gemini, llm, db), model, prompt tokens, image bytes, latency, time to
+    first token, cache hit, retries and error. Totals are kept for the whole
+    process; latency percentiles use the last max_records calls.
+    '''
+
+    def __init__(self, max_records=TRACE_MAX_RECORDS, path=TRACE_FILE, enabled=not TRACE_DISABLED):
+        self.enabled = enabled
+        self.path = path
+        self._records = deque(maxlen=max_records)
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, model, latency, ttft=None, prompt_tokens=0, output_tokens=0, image_bytes=0,
+               cache_hit=False, retries=0, error=None, session=None, **extra):
+        if not self.enabled:
+            return
+        record = {
+            "ts": time.time(), "session": session or current_session.get(), "kind": kind, "model": model,
+            "latency": latency, "ttft": ttft, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens,
+            "image_bytes": image_bytes, "cache_hit": cache_hit, "retries": retries, "error": error, **extra,
+        }
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals.setdefault((kind, model), dict.fromkeys(FIELDS, 0))
+            totals["calls"] += 1
+            totals["errors"] += error is not None
+            totals["cache_hits"] += bool(cache_hit)
+            totals["retries"] += retries
+            totals["prompt_tokens"] += prompt_tokens or 0
+            totals["output_tokens"] += output_tokens or 0
+            totals["image_bytes"] += image_bytes or 0
+            totals["latency"] += latency
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    def span(self, kind, model, **fields):
+        '''
+        Context manager that records the call when the block ends. The block
+        can add fields (cache_hit, retries, ttft, ...) to the yielded dict.
+        '''
+        return _Span(self, {"kind": kind, "model": model, **fields})
+
+    def stream(self, response, kind, model, started, **fields):
+        return TracedStream(response, self, {"kind": kind, "model": model, **fields}, started)
+
+    def records(self, session=None):
+        with self._lock:
+            records = list(self._records)
+        if session is not None:
+            records = [record for record in records if record["session"] == session]
+        return records
+
+    def summary(self, session=None):
+        '''
+        Per (kind, model) aggregates of the retained records.
+        '''
+        groups = {}
+        for record in self.records(session):
+            groups.setdefault((record["kind"], record["model"]), []).append(record)
+        rows = []
+        for (kind, model), records in sorted(groups.items()):
+            latencies = [record["latency"] for record in records]
+            ttfts = [record["ttft"] for record in records if record["ttft"] is not None]
+            rows.append({
+                "kind": kind,
+                "model": model,
+                "calls": len(records),
+                "p50_s": _percentile(latencies, 0.5),
+                "p95_s": _percentile(latencies, 0.95),
+                "ttft_p50_s": _percentile(ttfts, 0.5),
+                "total_s": sum(latencies),
+                "prompt_tokens": sum(record["prompt_tokens"] or 0 for record in records),
+                "image_mb": sum(record["image_bytes"] or 0 for record in records) / 1024 / 1024,
+                "cache_hits": sum(bool(record["cache_hit"]) for record in records),
+                "retries": sum(record["retries"] for record in records),
+                "errors": sum(record["error"] is not None for record in records),
+            })
+        return rows
+
+    def to_jsonl(self, session=None):
+        return "".join(json.dumps(record, default=str) + "\n" for record in self.records(session))
+
+    def to_prometheus(self):
+        '''
+        Prometheus text exposition of the process totals and latency quantiles.
+        '''
+        with self._lock:
+            totals = {key: dict(value) for key, value in self._totals.items()}
+        records = self.records()
+        lines = []
+
+        def labels(kind, model, **extra):
+            pairs = {"kind": kind, "model": model, **extra}
+            return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs.items())
+
+        counters = [
+            ("genai_calls_total", "calls", "Model and database calls."),
+            ("genai_call_errors_total", "errors", "Calls that raised."),
+            ("genai_cache_hits_total", "cache_hits", "Calls answered from a cache."),
+            ("genai_call_retries_total", "retries", "Retries after rate limiting or transient errors."),
+            ("genai_prompt_tokens_total", "prompt_tokens", "Estimated prompt tokens sent."),
+            ("genai_output_tokens_total", "output_tokens", "Output tokens reported by the model."),
+            ("genai_image_bytes_total", "image_bytes", "Image bytes uploaded."),
+        ]
+        for metric, field, help_text in counters:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f"{metric}{{{labels(*key)}}} {value[field]}" for key, value in sorted(totals.items())]
+
+        for metric, field, help_text in (
+            ("genai_call_latency_seconds", "latency", "Call latency."),
+            ("genai_time_to_first_token_seconds", "ttft", "Time to the first streamed chunk."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} summary"]
+            for key in sorted(totals):
+                values = [r[field] for r in records if (r["kind"], r["model"]) == key and r[field] is not None]
+                if not values:
+                    continue
+                for q in (0.5, 0.95):
+                    lines.append(f"{metric}{{{labels(*key, quantile=q)}}} {_percentile(values, q):.6f}")
+                lines.append(f"{metric}_sum{{{labels(*key)}}} {sum(values):.6f}")
+                lines.append(f"{metric}_count{{{labels(*key)}}} {len(values)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    def __init__(self, tracer, call):
+        self.tracer = tracer
+        self.call = call
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self.call
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.call["error"] = exc_type.__name__
+        self.call["latency"] = time.perf_counter() - self.started
+        self.tracer.record(**self.call)
+        return False
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    '''
+    Process-wide Tracer shared by every session.
+    '''
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
@@ -3,6 +3,13 @@ from PIL import Image
 import os
 import google.generativeai as genai
 from google.generativeai import GenerativeModel
+from src.gemini import generate_content
+from src.backends import get_generative_model
+from src.chat_session import get_analysis_chat
+from src.trace_panel import bind_session, show_trace_panel
+from src.preprocess import describe_savings, open_upload, prepare_images
+from src.packing import generate_packed
+from src.parallel import run_in_parallel
 import os
 
 # Load the API key from environment variables
@@ -11,21 +18,20 @@ genai.configure(api_key=os.getenv("GOOGLE_API_key"))
 
 # Function to perform image analysis
 def analyze_image(image, prompt):
-    model = genai.GenerativeModel('gemini-pro-vision')
-    response = model.generate_content([prompt, image])
+    model = get_generative_model('gemini-pro-vision')
+    response = generate_content(model, [prompt, image])
     return response.text
 
-# Function to handle chat messages
-def send_chat_message(model, history, user_message):
-    history.append({"text": user_message, "sender": "user"})
-    response = model.generate_content(history=history)
-    if response:
-        history.append({"text": response.text, "sender": "ai"})
-    return history, response.text
+# Function to analyze several slides in as few requests as possible
+def analyze_slides_together(prepared, prompt):
+    model = get_generative_model('gemini-pro-vision')
+    return generate_packed(model, prompt, prepared)
 
 # Main function to run the Streamlit app
 def main():
     st.set_page_config(page_title="PowerPoint Slide Analysis", layout="wide")
+    bind_session()
+    chat = get_analysis_chat()  # Kept in session state across reruns
     st.title("PowerPoint Slide Analysis with AI")
     st.markdown("---")
 
@@ -41,54 +47,62 @@ def main():
             "Emotional Tone": "Gauge the overall emotional sentiment conveyed by the slides.",
             "Time-Based Organization": "Cluster slides based on creation date or presentation sequence."
         }
+        # Analyses that compare slides are sent as one packed request
+        cross_slide_options = {"Visual Analysis", "Time-Based Organization"}
         input_prompt = st.selectbox("Select Analysis Type:", list(analysis_options.keys()))
-        upload_file = st.file_uploader("Upload Slide Image:", type=["jpg", "jpeg", "png"])
+        upload_files = st.file_uploader("Upload Slide Image(s):", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
 
-        if upload_file:
-            image = Image.open(upload_file)
+        images = []
+        for upload_file in upload_files or []:
+            image = open_upload(upload_file)
+            images.append(image)
             st.image(image, caption="Uploaded Slide", use_column_width=True)
 
         submit = st.button("Analyze Slide")
 
-        if submit and upload_file:
+        if submit and images:
             selected_prompt = analysis_options[input_prompt]
-            response = analyze_image(image, selected_prompt)
-            st.subheader("Analysis Result:")
-            st.write(response)
-        elif submit and not upload_file:
+            prepared = prepare_images(images)
+            st.caption(describe_savings(prepared))
+            if len(prepared) > 1 and input_prompt in cross_slide_options:
+                overviews, sections = analyze_slides_together(prepared, selected_prompt)
+                st.subheader("Analysis Result:")
+                for overview in overviews:
+                    st.write(overview)
+                for idx, section in enumerate(sections):
+                    if section:
+                        st.subheader(f"Slide {idx + 1}:")
+                        st.write(section)
+                results = overviews + [f"Slide {idx + 1}: {section}" for idx, section in enumerate(sections) if section]
+            else:
+                # A failed slide gets an error line; the others keep their results
+                responses = run_in_parallel(lambda p: analyze_image(p.blob, selected_prompt), prepared,
+                                            return_exceptions=True)
+                responses = [f"An error occurred: {str(response)}" if isinstance(response, Exception) else response
+                             for response in responses]
+                for idx, response in enumerate(responses):
+                    st.subheader("Analysis Result:" if len(responses) == 1 else f"Analysis Result for Slide {idx + 1}:")
+                    st.write(response)
+                results = [f"Slide {idx + 1}: {response}" for idx, response in enumerate(responses)]
+            # Follow-up questions are about this result
+            chat.set_context("\n\n".join(results))
+        elif submit and not images:
             st.error("Please upload an image to analyze.")
 
     with col2:
         st.header("Chat About the Results")
-        # Initialize the chat model
-        chat_model = genai.GenerativeModel('gemini-pro')
-
-        # Session state to keep track of chat history
-        if 'chat_history' not in st.session_state:
-            st.session_state['chat_history'] = []
+        # Displaying the chat history
+        for turn in chat.transcript:
+            st.write(f"{turn['sender'].title()}: {turn['text']}")
 
         chat_input = st.text_input("Your message:", key="chat_input")
         send_message = st.button("Send", key="send_message")
 
         if send_message and chat_input:
-            # Update chat history with the user message and the model's response
-            st.session_state['chat_history'], response = send_chat_message(
-                chat_model,
-                st.session_state['chat_history'],
-                chat_input
-            )
-            # Display the conversation
-            for chat in st.session_state['chat_history']:
-                if chat["sender"] == "user":
-                    st.text_area("", chat["text"], key=str(chat), height=40, disabled=True)
-                else:
-                    st.text_area("", chat["text"], key=str(chat), height=80, disabled=True, background_color="#E8E8E8")
-            # Clear the chat input box after sending the message
-            st.session_state.chat_input = ""
+            st.write("Ai:")
+            st.write_stream(chat.send(chat_input))
 
-        # Displaying the chat history
-        for chat in st.session_state['chat_history']:
-            st.write(f"{chat['sender'].title()}: {chat['text']}")
+    show_trace_panel()
 
 if __name__ == "__main__":
     main()
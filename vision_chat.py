@@ -3,46 +3,51 @@ import streamlit as st
 from PIL import Image
 import google.generativeai as genai
 import os
+from src.gemini import generate_content
+from src.backends import get_generative_model
+from src.chat_session import get_analysis_chat
+from src.trace_panel import bind_session, show_trace_panel
+from src.preprocess import describe_savings, open_upload, prepare_image
 
 load_dotenv()  # Take environment variables from .env.
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 def get_gemini_response(input, image):
-    model = genai.GenerativeModel('gemini-pro-vision')
+    model = get_generative_model('gemini-pro-vision')
     if input != "":
-        response = model.generate_content([input, image])
+        response = generate_content(model, [input, image])
     else:
-        response = model.generate_content(image)
+        response = generate_content(model, image)
     return response.text
 
 def handle_button_click(prompt, image):
-    model = genai.GenerativeModel('gemini-pro-vision')
+    model = get_generative_model('gemini-pro-vision')
     response = None  # Initialize response as None
 
     try:
         if prompt == "General Analysis":
             if image:  # Check if image is not empty
-                response = model.generate_content(["Identify and describe everything and every words you see in this image.", image])
+                response = generate_content(model, ["Identify and describe everything and every words you see in this image.", image])
             else:
                 return "Please upload an image for analysis."
         elif prompt == "Disease Identification":
             if image:  # Check if image is not empty
-                response = model.generate_content(["Identify the disease or medical condition shown in the image, if any.", image])
+                response = generate_content(model, ["Identify the disease or medical condition shown in the image, if any.", image])
             else:
                 return "Please upload an image for analysis."
         elif prompt == "Personalized Diet Plans Based on Bangladeshi Foods":
             if image:  # Check if image is not empty
-                response = model.generate_content(["Generate a personalized diet plan incorporating Bangladeshi foods based on the depicted health condition or dietary requirements in the image.", image])
+                response = generate_content(model, ["Generate a personalized diet plan incorporating Bangladeshi foods based on the depicted health condition or dietary requirements in the image.", image])
             else:
                 return "Please upload an image for analysis."
         elif prompt == "Health Tips and Lifestyle Recommendations":
             if image:  # Check if image is not empty
-                response = model.generate_content(["Offer health tips and lifestyle recommendations suitable for the observed health scenario in the image.", image])
+                response = generate_content(model, ["Offer health tips and lifestyle recommendations suitable for the observed health scenario in the image.", image])
             else:
                 return "Please upload an image for analysis."
         elif prompt == "Medicine Information":
             if image:  # Check if image is not empty
-                response = model.generate_content(["Provide information about Medicine Information such as indication, dosages, side effects, and medications or treatments related to the health issue depicted in the image.", image])
+                response = generate_content(model, ["Provide information about Medicine Information such as indication, dosages, side effects, and medications or treatments related to the health issue depicted in the image.", image])
             else:
                 return "Please upload an image for analysis."
         else:
@@ -52,14 +57,10 @@ def handle_button_click(prompt, image):
 
     return response.text if response else "No response generated for this prompt."
 
-def start_gemini_chat(history=[]):
-    model = genai.GenerativeModel('gemini-pro')
-    return model.start_chat(history=history)
-
 def main():
-    chat = None  # Initialize chat object
-    
     st.set_page_config(page_title="Gemini Image Demo", layout="wide")
+    bind_session()
+    chat = get_analysis_chat()  # Kept in session state across reruns
     st.title("AI Image Analysis")
     st.markdown("---")
 
@@ -73,7 +74,7 @@ def main():
         upload_file = st.file_uploader("Upload Image:", type=["jpg", "Jpeg", "png"])
         
         if upload_file is not None:
-            image = Image.open(upload_file)
+            image = open_upload(upload_file)
             st.image(image, caption="Uploaded Image", use_column_width=True)
         else:
             image = ""
@@ -82,7 +83,13 @@ def main():
 
         if submit:
             if input_prompt:
-                response = handle_button_click(input_prompt, image)
+                if image:
+                    prepared = prepare_image(image)
+                    st.caption(describe_savings([prepared]))
+                    response = handle_button_click(input_prompt, prepared.blob)
+                    chat.set_context(response)  # Follow-up questions are about this result
+                else:
+                    response = handle_button_click(input_prompt, image)
                 if isinstance(response, str):
                     st.warning(response)
                 else:
@@ -94,23 +101,20 @@ def main():
     with col2:
         st.markdown("---")
         st.header("Chat About the Results")
-        if chat is None:
-            chat = start_gemini_chat()  # Initialize chat if not done already
+        for turn in chat.transcript:
+            st.write(f"{'You' if turn['sender'] == 'user' else 'Gemini'}: {turn['text']}")
 
-        if chat is not None:
-            chat_input = st.text_input("Chat Input:", key="chat_input")
-            send_message = st.button("Send")
+        chat_input = st.text_input("Chat Input:", key="chat_input")
+        send_message = st.button("Send")
 
-            if send_message:
-                if chat_input:
-                    response = chat.send_message(chat_input, stream=True)
-                    st.subheader("Gemini's Response:")
-                    for chunk in response:
-                        st.write(chunk.text)
-                else:
-                    st.warning("Please input a message to chat.")
-        else:
-            st.warning("Please wait... Initializing the chat.")
+        if send_message:
+            if chat_input:
+                st.subheader("Gemini's Response:")
+                st.write_stream(chat.send(chat_input))
+            else:
+                st.warning("Please input a message to chat.")
+
+    show_trace_panel()
 
 if __name__ == "__main__":
     main()
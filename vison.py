@@ -3,32 +3,36 @@ import streamlit as st
 from PIL import Image
 import google.generativeai as genai
 import os
+from src.gemini import generate_content
+from src.backends import get_generative_model
+from src.trace_panel import bind_session, show_trace_panel
+from src.preprocess import describe_savings, open_upload, prepare_image
 
 load_dotenv()  # Take environment variables from .env.
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 def get_gemini_response(input_text, image):
-    model = genai.GenerativeModel('gemini-pro-vision')
+    model = get_generative_model('gemini-pro-vision')
     if input_text != "":
-        response = model.generate_content([input_text, image])
+        response = generate_content(model, [input_text, image])
     else:
-        response = model.generate_content(image)
+        response = generate_content(model, image)
     return response
 
 def handle_button_click(prompt, image):
-    model = genai.GenerativeModel('gemini-pro-vision')
+    model = get_generative_model('gemini-pro-vision')
     response = None  # Initialize response as None
 
     if prompt == "General Analysis":
-        response = model.generate_content(["Identify and describe everything you see in this image.", image])
+        response = generate_content(model, ["Identify and describe everything you see in this image.", image])
     elif prompt == "Disease Identification":
-        response = model.generate_content(["Identify the disease or medical condition shown in the image, if any.", image])
+        response = generate_content(model, ["Identify the disease or medical condition shown in the image, if any.", image])
     elif prompt == "Personalized Diet Plans Based on Bangladeshi Foods":
-        response = model.generate_content(["Generate a personalized diet plan incorporating Bangladeshi foods based on the depicted health condition or dietary requirements in the image.", image])
+        response = generate_content(model, ["Generate a personalized diet plan incorporating Bangladeshi foods based on the depicted health condition or dietary requirements in the image.", image])
     elif prompt == "Health Tips and Lifestyle Recommendations":
-        response = model.generate_content(["Offer health tips and lifestyle recommendations suitable for the observed health scenario in the image.", image])
+        response = generate_content(model, ["Offer health tips and lifestyle recommendations suitable for the observed health scenario in the image.", image])
     elif prompt == "Medicine Information":
-        response = model.generate_content(["Provide information about Medicine Information such as indication, dosages, side effects, and medications or treatments related to the health issue depicted in the image.", image])
+        response = generate_content(model, ["Provide information about Medicine Information such as indication, dosages, side effects, and medications or treatments related to the health issue depicted in the image.", image])
     else:
         return "Invalid prompt selected. Please choose a valid option."
 
@@ -36,6 +40,7 @@ def handle_button_click(prompt, image):
 
 def main():
     st.set_page_config(page_title="Gemini Image Demo", layout="wide")
+    bind_session()
     
     st.title("AI Image Analysis")
     st.markdown("---")
@@ -50,7 +55,7 @@ def main():
         upload_file = st.file_uploader("Upload Image:", type=["jpg", "Jpeg", "png"])
         
         if upload_file is not None:
-            image = Image.open(upload_file)
+            image = open_upload(upload_file)
             st.image(image, caption="Uploaded Image", use_column_width=True)
         else:
             image = ""
@@ -59,7 +64,12 @@ def main():
 
         if submit:
             if input_prompt:
-                response = handle_button_click(input_prompt, image)
+                if image:
+                    prepared = prepare_image(image)
+                    st.caption(describe_savings([prepared]))
+                    response = handle_button_click(input_prompt, prepared.blob)
+                else:
+                    response = handle_button_click(input_prompt, image)
                 if isinstance(response, str):
                     st.warning(response)
                 else:
@@ -83,8 +93,15 @@ def main():
         st.subheader("Result from Input Text:")
         result_button = st.button("Show Result")
         if result_button:
-            input_text_response = get_gemini_response(input_text, image)
+            if image:
+                prepared = prepare_image(image)
+                st.caption(describe_savings([prepared]))
+                input_text_response = get_gemini_response(input_text, prepared.blob)
+            else:
+                input_text_response = get_gemini_response(input_text, image)
             st.write(input_text_response.text)  # Assuming .text attribute contains the generated text
 
+    show_trace_panel()
+
 if __name__ == "__main__":
     main()